@@ -4,135 +4,490 @@ This wrapper adds extra functionality to the IndicatorDataset class, for easier
 data manipulation and generating Orange data tables.
 """
 
+import calendar
+import collections
 import datetime
-import time
+import functools
+import itertools
+import json
 import logging
+import threading
+import time
+import urllib
+from concurrent import futures
 
 import numpy as np
 
 import Orange
 import simple_wbd
+from orangecontrib.datasets import cache
 from orangecontrib.datasets import countries
+from orangecontrib.datasets import snapshot
+from orangecontrib.datasets import transport
 
 logger = logging.getLogger(__name__)
 
+MAX_WORKERS = 8
 
-class IndicatorDataset(simple_wbd.IndicatorDataset):
-    """Extended indicator dataset.
+# Estimates used for planning indicator queries.
+MAX_URL_LENGTH = 1024
+POINTS_PER_COUNTRY = 60  # about one value per year since 1960
+BYTES_PER_POINT = 150  # size of a single data point in a JSON response
+REQUEST_COST = 0.3  # seconds of latency per request
+BANDWIDTH = 1e6  # bytes per second
+MAX_BATCH_INDICATORS = 60  # indicators in a single combined request
+MAX_BATCH_TEXT = 256  # url characters reserved for combined indicator ids
+CANCEL_POLL_INTERVAL = 0.1  # seconds
+PROGRESS_RATE = 5  # maximum progress updates per second
+CLIMATE_RETRIES = 2  # extra attempts for a failed climate query
+RETRY_DELAY = 0.5  # seconds before the first retry, doubled on each retry
 
-    This class extends the original indicator dataset by adding as_np_array and
-    as_orange_table functions.
+
+class FetchCancelled(Exception):
+    """Raised when a running fetch is cancelled."""
+
+
+class ProgressObserver(object):
+    """Thread safe progress tracker for API requests.
+
+    A request consists of units, such as indicators or climate queries, and
+    each unit consists of one or more pages. Worker threads report finished
+    pages and units, and the callback is called with the current progress at
+    most max_rate times per second, and always when all units are done.
+
+    Args:
+        callback: function that receives percent done, fetched pages per
+            second and estimated remaining seconds (NaN when unknown).
+        max_rate: maximum number of callback calls per second.
+    """
+
+    def __init__(self, callback=None, max_rate=PROGRESS_RATE):
+        self._callback = callback
+        self._interval = 1 / max_rate
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._last_report = float("-inf")
+        self._units = 0
+        self._done = set()
+        self._pages = {}
+        self.pages_done = 0
+
+    def add_units(self, count):
+        """Add the number of units that will be reported."""
+        with self._lock:
+            self._units += count
+        self._report()
+
+    def page_done(self, unit, pages):
+        """Report a fetched page of a unit that has the given page count."""
+        with self._lock:
+            done, _ = self._pages.get(unit, (0, pages))
+            self._pages[unit] = (done + 1, pages)
+            self.pages_done += 1
+        self._report()
+
+    def unit_done(self, unit):
+        """Report a unit as fully fetched, loaded from cache or failed."""
+        with self._lock:
+            self._done.add(unit)
+            self._pages.pop(unit, None)
+        self._report()
+
+    @property
+    def percent(self):
+        """Get the percent of finished work."""
+        with self._lock:
+            if not self._units:
+                return 100.0
+            partial_units = sum(done / pages
+                                for done, pages in self._pages.values())
+            return min(100 * (len(self._done) + partial_units) / self._units,
+                       100.0)
+
+    @property
+    def finished(self):
+        """Check if all units are done."""
+        with self._lock:
+            return len(self._done) >= self._units
+
+    def _report(self):
+        if self._callback is None:
+            return
+        now = time.monotonic()
+        finished = self.finished
+        with self._lock:
+            if not finished and now - self._last_report < self._interval:
+                return
+            self._last_report = now
+        elapsed = max(now - self._start, 1e-6)
+        percent = self.percent
+        rate = self.pages_done / elapsed
+        eta = elapsed * (100 - percent) / percent if percent else float("nan")
+        self._callback(percent, rate, eta)
+
+
+class FetchRequest(object):
+    """Handle for a single dataset request.
+
+    The handle holds progress, cancellation and timing of one request, so
+    that an API object can run multiple requests at the same time. It can be
+    cancelled from any thread.
+
+    Args:
+        progress_callback: optional ProgressObserver callback.
     """
 
+    def __init__(self, progress_callback=None):
+        self.observer = ProgressObserver(progress_callback)
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *_):
+        self.finished = time.monotonic()
+        logger.debug("Request finished in %.2f s, %d pages fetched",
+                     self.elapsed, self.observer.pages_done)
+
+    def cancel(self):
+        """Cancel the request."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        """Check if the request was cancelled."""
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raise FetchCancelled if the request was cancelled."""
+        if self.cancelled:
+            raise FetchCancelled()
+
+    def sleep(self, seconds):
+        """Wait for the given time and raise FetchCancelled if cancelled."""
+        self._cancel_event.wait(seconds)
+        self.check_cancelled()
+
+    @property
+    def progress(self):
+        """Get percent of finished work."""
+        return self.observer.percent
+
+    @property
+    def elapsed(self):
+        """Get running time of the request in seconds."""
+        if self.started is None:
+            return 0.0
+        end = time.monotonic() if self.finished is None else self.finished
+        return end - self.started
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_period(period):
+    """Convert a single wbd period string into epoch seconds.
+
+    Period strings such as "2005", "2002Q3" and "1999M7" are converted to the
+    UTC timestamp of the first day of the given period.
+
+    Returns:
+        float timestamp or NaN if the period is not a valid date string.
+    """
+    try:
+        period = period.upper()
+        if "Q" in period:
+            year, quarter = period.split("Q")
+            date_ = datetime.date(int(year), (int(quarter) * 3) - 2, 1)
+        elif "M" in period:
+            year, month = period.split("M")
+            date_ = datetime.date(int(year), int(month), 1)
+        else:
+            date_ = datetime.date(int(period), 1, 1)
+    except ValueError:
+        # some dates contain invalid date strings such as
+        # "Last Known Value" or "1988-2000" and possible some more. See:
+        # http://api.worldbank.org/countries/PRY/indicators/
+        #   per_lm_ac.avt_q4_urb?date=1960%3A2016&format=json
+        #   &per_page=10000
+        # http://api.worldbank.org/countries/all/indicators/
+        #   DB_mw_19apprentice?format=json&mrv=10&gapfill=y
+        return np.nan
+    return float(calendar.timegm(date_.timetuple()))
+
+
+def parse_periods(periods):
+    """Convert an array of wbd period strings into epoch seconds.
+
+    Each distinct period is parsed only once, and parsed values are memoized
+    between calls.
+
+    Args:
+        periods: iterable of period strings or years.
+
+    Returns:
+        float64 array of UTC timestamps with NaN for invalid periods.
+    """
+    periods = np.asarray(periods, dtype=object).astype(str)
+    if not periods.size:
+        return np.empty(0)
+    unique_periods, inverse = np.unique(periods, return_inverse=True)
+    seconds = np.array([_parse_period(period) for period in unique_periods],
+                       dtype=np.float64)
+    return seconds[inverse.ravel()]
+
+
+class QueryPlan(collections.namedtuple(
+        "QueryPlan", ["batches", "pages", "size", "cost"])):
+    """Estimated cost of fetching an indicator query.
+
+    Attributes:
+        batches: list of country texts for the query urls, either "all" or
+            semicolon separated alpha3 codes.
+        pages: estimated number of requests.
+        size: estimated response size in bytes.
+        cost: estimated fetch time in seconds.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
+
+class IndicatorSeries(collections.namedtuple(
+        "IndicatorSeries", ["country_ids", "countries", "dates", "values"])):
+    """Compact representation of data for a single indicator.
+
+    All fields are 1D arrays of equal length with one item per data point.
+    Missing or invalid values are stored as NaN.
+    """
+    # pylint: disable=too-few-public-methods
+    __slots__ = ()
+
+    @classmethod
+    def from_datapoints(cls, data):
+        """Create series from data points returned by the world bank API."""
+        def column(getter):
+            return np.array([getter(datapoint) for datapoint in data],
+                            dtype=object)
+
+        return cls(
+            column(lambda d: d.get("country", {}).get("id", "")),
+            column(lambda d: d.get("country", {}).get("value", "")),
+            column(lambda d: d.get("date", "")),
+            np.array(
+                [simple_wbd.IndicatorDataset._parse_value(d.get("value"))
+                 for d in data],
+                dtype=np.float64,
+            ),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Create series from arrays stored with as_arrays."""
+        return cls(
+            arrays["country_ids"].astype(object),
+            arrays["countries"].astype(object),
+            arrays["dates"].astype(object),
+            arrays["values"].astype(np.float64),
+        )
+
+    def as_arrays(self):
+        """Get a dict of arrays that can be stored without pickling."""
+        return {
+            "country_ids": self.country_ids.astype(str),
+            "countries": self.countries.astype(str),
+            "dates": self.dates.astype(str),
+            "values": self.values,
+        }
+
+    def take(self, index):
+        """Get a series with data points selected by an index or mask."""
+        return IndicatorSeries(*(column[index] for column in self))
+
+    @classmethod
+    def concatenate(cls, series_list):
+        """Join data points of multiple series into a single series."""
+        return cls(*(np.concatenate(columns) for columns in zip(*series_list)))
+
+    def datapoints(self):
+        """Generate data points in the world bank API format."""
+        for country_id, country, date, value in zip(*self):
+            yield {
+                "country": {"id": country_id, "value": country},
+                "date": date,
+                "value": None if np.isnan(value) else value,
+            }
+
+
+class CountryMetadata(object):
+    """Encoded country metadata for indicator country tables.
+
+    Country metadata only changes when the country list changes, so all
+    metadata columns are encoded once per country list and reused for every
+    generated table. Discrete columns are stored as float value indexes and
+    continuous columns as floats, with NaN for missing values.
+    """
+
+    CONTINUOUS = {"longitude", "latitude"}
+
+    _cache = collections.OrderedDict()
+    _cache_size = 4
+
+    def __init__(self, countries_):
+        names = np.array([country.get("name") or "" for country in countries_],
+                         dtype=object).astype(str)
+        self._order = np.argsort(names, kind="mergesort")
+        self._sorted_names = names[self._order]
+
+        self.variables = [Orange.data.StringVariable("Country")]
+        columns = []
+        for key, name in IndicatorDataset.METADATA_MAP.items():
+            if key == "name":
+                continue
+            column = np.array(
+                [self._get_value(country.get(key)) for country in countries_],
+                dtype=object,
+            ).astype(str)
+            if key in self.CONTINUOUS:
+                self.variables.append(Orange.data.ContinuousVariable(name))
+                columns.append(self._to_float(column))
+            else:
+                values, codes = self._encode(column)
+                self.variables.append(
+                    Orange.data.DiscreteVariable(name, values=values))
+                columns.append(codes)
+
+        # The last row is used for countries that are not in the list.
+        self._matrix = np.vstack([
+            np.column_stack(columns) if columns else np.empty((0, 0)),
+            np.full((1, len(columns)), np.nan),
+        ])
+
+    @classmethod
+    def from_countries(cls, countries_):
+        """Get encoded metadata for a list of countries.
+
+        Metadata is cached by the identity of the country list, such as the
+        list of the shared country catalog, so repeated calls with the same
+        list reuse the same encoding and Orange variables without looking at
+        its contents. Cached lists must not be modified.
+        """
+        key = id(countries_)
+        # The cache keeps a reference to the list, so its id is not reused.
+        cached = cls._cache.get(key)
+        if cached is not None and cached[0] is countries_:
+            cls._cache.move_to_end(key)
+        else:
+            cls._cache[key] = (countries_, cls(countries_))
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.popitem(last=False)
+        return cls._cache[key][1]
+
+    @staticmethod
+    def _get_value(value):
+        if isinstance(value, dict):
+            value = value.get("value")
+        return value or ""
 
     @staticmethod
-    def _get_iso_date(date_str):
-        """Convert wbd date string into iso format date string.
+    def _to_float(column):
+        result = np.full(len(column), np.nan)
+        mask = column != ""
+        result[mask] = column[mask].astype(float)
+        return result
 
-        Convert date strings such as "2005", "2002Q3" and "1999M7" into iso
-        formatted date strings "yyyy-mm-dd"
+    @staticmethod
+    def _encode(column):
+        """Encode a string column into discrete value indexes.
+
+        Returns:
+            tuple of sorted discrete values and float value indexes, where
+            empty strings are encoded as NaN.
         """
-        try:
-            if "Q" in date_str:
-                year, quarter = date_str.split("Q")
-                return datetime.date(int(year), (int(quarter) * 3) - 2, 1)
-            elif "M" in date_str:
-                year, month = date_str.split("M")
-                return datetime.date(int(year), int(month), 1)
-            else:
-                return datetime.date(int(date_str), 1, 1).isoformat()
-        except ValueError:
-            # some dates contain invalid date strings such as
-            # "Last Known Value" or "1988-2000" and possible some more. See:
-            # http://api.worldbank.org/countries/PRY/indicators/
-            #   per_lm_ac.avt_q4_urb?date=1960%3A2016&format=json
-            #   &per_page=10000
-            # http://api.worldbank.org/countries/all/indicators/
-            #   DB_mw_19apprentice?format=json&mrv=10&gapfill=y
-            return datetime.date.today().isoformat()
+        values, inverse = np.unique(column, return_inverse=True)
+        codes = inverse.astype(float)
+        if len(values) and values[0] == "":
+            # empty string is always sorted first
+            values = values[1:]
+            codes -= 1
+            codes[column == ""] = np.nan
+        return values.tolist(), codes
+
+    def meta_columns(self, names):
+        """Get the meta matrix for countries with the given names.
+
+        Args:
+            names: array of country names.
+
+        Returns:
+            2D object array with country names in the first column and encoded
+            metadata in the rest.
+        """
+        names = np.asarray(names, dtype=object).astype(str)
+        positions = np.searchsorted(self._sorted_names, names)
+        positions = np.minimum(positions, max(len(self._sorted_names) - 1, 0))
+        if len(self._sorted_names):
+            found = self._sorted_names[positions] == names
+            rows = np.where(found, self._order[positions], -1)
+        else:
+            rows = np.full(len(names), -1)
+
+        meta = np.empty((len(names), self._matrix.shape[1] + 1), dtype=object)
+        meta[:, 0] = names
+        meta[:, 1:] = self._matrix[rows]
+        return meta
+
+
+class IndicatorDataset(simple_wbd.IndicatorDataset):
+    """Extended indicator dataset.
+
+    This class extends the original indicator dataset by adding as_np_array and
+    as_orange_table functions.
+
+    Args:
+        api_responses: dict of indicator responses.
+        countries: list of country dicts, usually the list of the shared
+            country catalog.
+    """
+
+    def __init__(self, api_responses, countries=None):
+        super().__init__(api_responses, countries)
+        self.country_list = countries or []
 
     def _time_series_table(self):
-        data = self.as_np_array(time_series=True)
+        values, labels, headers = self.as_columns(time_series=True)
 
-        if not data.any():
+        if not values.size:
             return None
 
-        meta_columns = [[time.mktime(date_.timetuple()) if date_ else None]
-                        for date_ in data[1:, 0]]
-        data_columns = data[1:, 1:]
+        meta_columns = parse_periods(labels)[:, np.newaxis]
 
         meta_domains = [Orange.data.TimeVariable("Date")]
 
         colum_domains = [Orange.data.ContinuousVariable(column_name)
-                         for column_name in data[0, 1:]]
+                         for column_name in headers]
 
-        logger.debug("Generated Orange table of size: %s", data.shape)
+        logger.debug("Generated Orange table of size: %s", values.shape)
 
         domain = Orange.data.Domain(colum_domains, metas=meta_domains)
-        return Orange.data.Table(domain, data_columns, metas=meta_columns)
+        return Orange.data.Table(domain, values, metas=meta_columns)
 
     def _country_table(self):
+        data_columns, labels, headers = self.as_columns()
 
-        def nonesorter(a):
-            if not a:
-                return ""
-            return a
-
-        data = self.as_np_array(add_metadata=True)
-
-        if not data.any():
+        if not data_columns.size:
             return None
 
-        meta_columns = data[1:, :7]
-
-        data_columns = data[1:, 7:]
-        regions = {r: i for i, r in enumerate(sorted(set(meta_columns[:, 1]), key=nonesorter))}
-        admin_regions = {r: i for i, r in enumerate(sorted(set(meta_columns[:, 2]), key=nonesorter))}
-        income_level = {r: i for i, r in enumerate(sorted(set(meta_columns[:, 3]), key=nonesorter))}
-        lending_type = {r: i for i, r in enumerate(sorted(set(meta_columns[:, 6]), key=nonesorter))}
-
-        meta_domains = [
-          Orange.data.StringVariable("Country"),
-          Orange.data.DiscreteVariable(
-            "Region",
-            values=sorted(regions.keys(), key=nonesorter)
-          ),
-          Orange.data.DiscreteVariable(
-            "Admin region",
-            values=sorted(admin_regions.keys(), key=nonesorter)
-          ),
-          Orange.data.DiscreteVariable(
-            "Income level",
-            values=sorted(income_level.keys(), key=nonesorter)
-          ),
-          Orange.data.ContinuousVariable("Longitude"),
-          Orange.data.ContinuousVariable("Latitude"),
-          Orange.data.DiscreteVariable(
-            "Lending type",
-            values=sorted(lending_type.keys(), key=nonesorter)
-          ),
-        ]
+        metadata = CountryMetadata.from_countries(self.country_list)
+        meta_domains = metadata.variables
+        meta_columns = metadata.meta_columns(labels)
+
         column_domains = [Orange.data.ContinuousVariable(column_name)
-                         for column_name in data[0, 7:]]
-        for row in meta_columns:
-          row[1] = regions[row[1]]
-          row[2] = admin_regions[row[2]]
-          row[3] = income_level[row[3]]
-          row[6] = lending_type[row[6]]
+                          for column_name in headers]
 
-        logger.debug("Generated Orange table of size: %s", data.shape)
+        logger.debug("Generated Orange table of size: %s", data_columns.shape)
 
         domain = Orange.data.Domain(column_domains, metas=meta_domains)
-
-        data_columns = data_columns.astype(float)
-        data_columns = np.where(data_columns == np.array(None), np.nan, data_columns)
-        data_columns = np.where(data_columns == '', np.nan, data_columns)
-        meta_columns = np.where(meta_columns == np.array(None), np.nan, meta_columns)
-        meta_columns = np.where(meta_columns == '', np.nan, meta_columns)
-        for row in meta_columns[:, 1:]:
-            row[3] = float(row[3])
-            row[4] = float(row[4])
-
         return Orange.data.Table(domain, data_columns, metas=meta_columns)
 
     def as_np_array(self, time_series=False, add_metadata=False, **kwargs):
@@ -158,6 +513,66 @@ class IndicatorDataset(simple_wbd.IndicatorDataset):
         filter_ = [ind for ind, col in enumerate(data[1:, :].T) if any(col)]
         return data[:, filter_]
 
+    def _get_data_map(self, data, data_map=None, country_prefix="",
+                      date_prefix=""):
+        """Get data is a nested dictionary.
+
+        This extends the original function to also accept IndicatorSeries.
+        """
+        if isinstance(data, IndicatorSeries):
+            data = list(data.datapoints())
+        return super()._get_data_map(data, data_map=data_map,
+                                     country_prefix=country_prefix,
+                                     date_prefix=date_prefix)
+
+    def as_columns(self, time_series=False):
+        """Get a columnar data representation.
+
+        This is a faster alternative to as_np_array. Values are stored in a
+        typed float array and row labels and column headers are returned
+        separately, so there is no need for object arrays. Columns that
+        contain no values are removed.
+
+        Args:
+            time_series: boolean indicating if the rows should contain dates
+                instead of countries. See as_np_array.
+
+        Returns:
+            tuple (values, labels, headers) where values is a 2D float64
+            array, labels a 1D array of row countries or dates, and headers a
+            list of column names.
+        """
+        prefix_columns = len(self.api_responses) > 1
+        row_keys, column_keys, values = [], [], []
+        for indicator, data in self.api_responses.items():
+            if not isinstance(data, IndicatorSeries):
+                data = IndicatorSeries.from_datapoints(data)
+            if time_series:
+                rows, columns = data.dates, data.countries
+            else:
+                rows, columns = data.countries, data.dates
+            if prefix_columns:
+                columns = (indicator + " - ") + columns
+            row_keys.append(rows)
+            column_keys.append(columns)
+            values.append(data.values)
+
+        if not values or not sum(len(v) for v in values):
+            return np.empty((0, 0)), np.empty(0, dtype=object), []
+
+        labels, row_index = np.unique(np.concatenate(row_keys).astype(str),
+                                      return_inverse=True)
+        headers, column_index = np.unique(
+            np.concatenate(column_keys).astype(str), return_inverse=True)
+
+        matrix = np.full((len(labels), len(headers)), np.nan)
+        matrix[row_index, column_index] = np.concatenate(values)
+
+        # keep only columns that have at least one value
+        filter_ = ~np.isnan(matrix).all(axis=0)
+        return matrix[:, filter_], labels.astype(object), \
+            headers[filter_].tolist()
+
     def as_orange_table(self, time_series=False):
         if time_series:
             return self._time_series_table()
@@ -166,10 +581,596 @@ class IndicatorDataset(simple_wbd.IndicatorDataset):
 
 
 class IndicatorAPI(simple_wbd.IndicatorAPI):
-    """Wrapper for Indicator API to use the extended data set."""
+    """Wrapper for Indicator API to use the extended data set.
+
+    Indicators, and pages of a single indicator, are fetched concurrently
+    with a bounded pool of worker threads. Indicators from the same source
+    are requested together in combined requests, when the indicator list has
+    already been loaded.
+
+    Args:
+        data_cache: Optional DatasetCache used for storing fetched indicator
+            data.
+        max_workers: Maximum number of concurrent requests.
+    """
+
+    PER_PAGE = 5000
+    INDICATOR_QUERY = ("countries/{countries}/indicators/{indicator}"
+                       "?format=json&per_page=5000")
+    BATCH_QUERY = ("v2/country/{countries}/indicator/{indicators}"
+                   "?source={source}&format=json&per_page=5000")
+    SERIES_STORE_SIZE = 64
 
-    def __init__(self):
+    # The indicator list is shared by all instances, so that the list loaded
+    # for the indicator view also provides sources for batched requests.
+    _indicator_list = None
+    _indicator_sources = None
+    _indicators_from_snapshot = False
+    _indicator_list_lock = threading.Lock()
+
+    def __init__(self, data_cache=None, max_workers=MAX_WORKERS):
         super().__init__(IndicatorDataset)
+        self.data_cache = data_cache
+        self.max_workers = max_workers
+        self._series_store = collections.OrderedDict()
+        self._series_store_lock = threading.Lock()
+
+    def get_countries(self):
+        """Get a list of countries and regions.
+
+        See simple_wbd.IndicatorAPI.get_countries. This version returns the
+        list from the shared country catalog.
+        """
+        return countries.get_catalog().countries
+
+    def _get_countries_map(self):
+        """Get a map from country name or code to alpha3 code."""
+        return countries.get_catalog().alpha3_map
+
+    def get_indicators(self, filter_="Common", refresh=False):
+        """Get a list of indicators.
+
+        See simple_wbd.IndicatorAPI.get_indicators. This version uses the
+        shared transport and keeps the parsed list of all indicators in
+        memory, so that switching between filters does not parse it again.
+
+        The list is loaded from a cached response if there is one, and
+        otherwise from the API. The bundled snapshot is used only if the API
+        can not be reached and no list has been loaded yet. A list loaded from
+        the snapshot should be refreshed, see indicators_from_snapshot.
+
+        Args:
+            filter_ (str): Common or Featured. Leave empty for all indicators.
+            refresh (bool): Fetch a new list from the API and wait for it.
+        """
+        cls = IndicatorAPI
+        indicator_query = "indicators" + self.GET_PARAMS
+        url = urllib.parse.urljoin(self.BASE_URL, indicator_query)
+        indicators = None
+        with cls._indicator_list_lock:
+            if not refresh:
+                indicators = cls._indicator_list
+            if indicators is None and not refresh:
+                cached = transport.get_cached(url)
+                if cached is not None:
+                    indicators = json.loads(cached)[1]
+                    cls._indicator_list = indicators
+                    cls._indicator_sources = None
+                    cls._indicators_from_snapshot = False
+
+        if indicators is None:
+            # The lock is not held here, so that a slow download does not
+            # block readers of the current list.
+            try:
+                indicators = json.loads(
+                    transport.fetch(url, use_cache=not refresh))[1]
+                from_snapshot = False
+            except Exception:  # pylint: disable=broad-except
+                indicators = None
+                if cls._indicator_list is None:
+                    indicators = snapshot.get_indicators()
+                if indicators is None:
+                    raise
+                logger.warning("Failed to fetch the indicator list, using "
+                               "the bundled snapshot.", exc_info=True)
+                from_snapshot = True
+            with cls._indicator_list_lock:
+                cls._indicator_list = indicators
+                cls._indicator_sources = None
+                cls._indicators_from_snapshot = from_snapshot
+
+        if filter_:
+            return self._filter_indicators(indicators, filter_)
+
+        return list(indicators)
+
+    @property
+    def indicators_from_snapshot(self):
+        """Check if the shared indicator list was loaded from the snapshot."""
+        return IndicatorAPI._indicators_from_snapshot
+
+    @staticmethod
+    def _get_indicator_sources():
+        """Get a map from lower case indicator id to its source id.
+
+        The map is built from the shared indicator list. It is empty if the
+        list has not been loaded yet, since downloading the whole list only
+        for batching would cost more than it saves.
+        """
+        cls = IndicatorAPI
+        with cls._indicator_list_lock:
+            if cls._indicator_sources is None:
+                if cls._indicator_list is None:
+                    return {}
+                cls._indicator_sources = {
+                    indicator.get("id", "").lower():
+                        (indicator.get("source") or {}).get("id")
+                    for indicator in cls._indicator_list
+                }
+            return cls._indicator_sources
+
+    def _batch_indicators(self, indicator_ids):
+        """Split indicators into batches that can be requested together.
+
+        Indicators from the same source are batched in the given order, with
+        at most MAX_BATCH_INDICATORS indicators and MAX_BATCH_TEXT url
+        characters per batch. Indicators with an unknown source are requested
+        one by one.
+
+        Returns:
+            list of tuples of indicator ids.
+        """
+        sources = self._get_indicator_sources()
+        batches = []
+        open_batches = {}
+        for indicator in indicator_ids:
+            source = sources.get(indicator)
+            batch = open_batches.get(source)
+            if (source is None or batch is None or
+                    len(batch) >= MAX_BATCH_INDICATORS or
+                    len(";".join(batch + [indicator])) > MAX_BATCH_TEXT):
+                batch = [indicator]
+                batches.append(batch)
+                if source is not None:
+                    open_batches[source] = batch
+            else:
+                batch.append(indicator)
+        return [tuple(batch) for batch in batches]
+
+    def _get_batch_url(self, alpha3_text, batch, period=""):
+        """Get the url for the first page of an indicator batch."""
+        if len(batch) == 1:
+            query = self.INDICATOR_QUERY.format(countries=alpha3_text,
+                                                indicator=batch[0])
+        else:
+            query = self.BATCH_QUERY.format(
+                countries=alpha3_text,
+                indicators=";".join(batch),
+                source=self._get_indicator_sources()[batch[0]],
+            )
+        return urllib.parse.urljoin(self.BASE_URL, query) + period
+
+    @staticmethod
+    def _split_batch(batch, datapoints):
+        """Split data points of a combined request into indicator series.
+
+        Returns:
+            dict of IndicatorSeries for all indicators in the batch.
+        """
+        if len(batch) == 1:
+            return {batch[0]: IndicatorSeries.from_datapoints(datapoints)}
+        split = collections.defaultdict(list)
+        for datapoint in datapoints:
+            indicator = (datapoint.get("indicator") or {}).get("id", "")
+            split[indicator.lower()].append(datapoint)
+        return {indicator: IndicatorSeries.from_datapoints(split[indicator])
+                for indicator in batch}
+
+    @staticmethod
+    def _get_period(date=None, mrv=None):
+        """Get url parameters for a requested time period.
+
+        Args:
+            date: tuple of first and last year or None for all years.
+            mrv: number of most recent values per country or None for all
+                values.
+
+        Returns:
+            tuple of url parameters, which are empty for the whole period, and
+            estimated number of data points per country.
+        """
+        params, points = "", POINTS_PER_COUNTRY
+        if date is not None:
+            start, end = sorted(int(year) for year in date)
+            params += "&date={}:{}".format(start, end)
+            points = min(points, end - start + 1)
+        if mrv:
+            params += "&mrv={}".format(int(mrv))
+            points = min(points, int(mrv))
+        return params, points
+
+    @staticmethod
+    def _get_cache_key(alpha3_text, indicator, period=""):
+        return cache.make_key(
+            "indicator",
+            indicator,
+            sorted(alpha3_text.upper().split(";")),
+            period,
+        )
+
+    def _get_cached_series(self, alpha3_text, indicator, period=""):
+        if self.data_cache is None:
+            return None
+        arrays = self.data_cache.get(
+            self._get_cache_key(alpha3_text, indicator, period))
+        if arrays is None:
+            return None
+        logger.debug("Using cached data for indicator %s", indicator)
+        return IndicatorSeries.from_arrays(arrays)
+
+    def _set_cached_series(self, alpha3_text, indicator, series, period=""):
+        if self.data_cache is not None:
+            self.data_cache.put(
+                self._get_cache_key(alpha3_text, indicator, period),
+                series.as_arrays())
+
+    @staticmethod
+    def _fetch_page(url, page=1):
+        """Fetch a single page of indicator data.
+
+        Returns:
+            tuple of response header dict and a list of data points.
+        """
+        if page > 1:
+            url = "{url}&page={page}".format(url=url, page=page)
+        response_json = json.loads(transport.fetch(url))
+        header = response_json[0] if len(response_json) > 0 else {}
+        data = response_json[1] if len(response_json) > 1 else []
+        return header, data or []
+
+    def _fetch_indicators(self, queries, request, period=""):
+        """Fetch data for multiple indicator and country batches concurrently.
+
+        First pages for all batches are requested at once, and the remaining
+        pages of a batch are requested as soon as its first page reports the
+        page count. All requests are made from a single bounded worker pool.
+
+        Args:
+            queries: list of tuples of semicolon separated alpha3 codes or
+                "all", and a list of indicator batches for those countries,
+                see _batch_indicators.
+            request: FetchRequest that receives page and batch events. When
+                it is cancelled, requests that have not started yet are
+                dropped and FetchCancelled is raised.
+            period: url parameters that limit the requested time period.
+
+        Returns:
+            dict of alpha3 texts and dicts of IndicatorSeries for all
+            successfully fetched indicators.
+        """
+        observer = request.observer
+        urls = collections.OrderedDict(
+            ((batch, alpha3_text),
+             self._get_batch_url(alpha3_text, batch, period))
+            for alpha3_text, batches in queries
+            for batch in batches
+        )
+        pages = collections.OrderedDict()
+        done = set()
+        executor = futures.ThreadPoolExecutor(self.max_workers)
+        pending = {}
+        try:
+            pending.update({
+                executor.submit(self._fetch_page, url): (unit, 1)
+                for unit, url in urls.items()
+            })
+            while pending:
+                finished, _ = futures.wait(
+                    pending, timeout=CANCEL_POLL_INTERVAL,
+                    return_when=futures.FIRST_COMPLETED)
+                request.check_cancelled()
+                for future in finished:
+                    unit, page = pending.pop(future)
+                    if unit in done:
+                        continue
+                    try:
+                        header, data = future.result()
+                    except Exception:  # pylint: disable=broad-except
+                        # We should avoid any errors that can occur due to api
+                        # responses or invalid data.
+                        logger.warning("Failed to fetch indicators: %s",
+                                       unit, exc_info=True)
+                        pages.pop(unit, None)
+                        done.add(unit)
+                        observer.unit_done(unit)
+                        continue
+                    if page == 1:
+                        page_count = max(int(header.get("pages") or 1), 1)
+                        pages[unit] = [None] * page_count
+                        for next_page in range(2, page_count + 1):
+                            next_future = executor.submit(
+                                self._fetch_page, urls[unit], next_page)
+                            pending[next_future] = (unit, next_page)
+                    pages[unit][page - 1] = data
+                    observer.page_done(unit, len(pages[unit]))
+                    if all(p is not None for p in pages[unit]):
+                        done.add(unit)
+                        observer.unit_done(unit)
+        finally:
+            # Requests that are already running can not be interrupted, but
+            # their results are dropped and queued requests are never sent.
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        result = collections.defaultdict(dict)
+        for (batch, alpha3_text), batch_pages in pages.items():
+            split = self._split_batch(
+                batch, list(itertools.chain.from_iterable(batch_pages)))
+            for indicator, series in split.items():
+                self._set_cached_series(alpha3_text, indicator, series, period)
+                result[alpha3_text][indicator] = series
+        return result
+
+    def _get_stored_series(self, key):
+        """Get stored country codes and series for an indicator.
+
+        Args:
+            key: tuple of indicator id and period url parameters.
+
+        Returns:
+            tuple of a frozenset of upper case alpha3 codes, or None if data
+            for all countries is stored, and IndicatorSeries. Returns None if
+            nothing is stored for the indicator and period.
+        """
+        with self._series_store_lock:
+            if key not in self._series_store:
+                return None
+            self._series_store.move_to_end(key)
+            return self._series_store[key]
+
+    def _store_series(self, key, alpha3_codes, series):
+        with self._series_store_lock:
+            self._series_store[key] = (alpha3_codes, series)
+            self._series_store.move_to_end(key)
+            while len(self._series_store) > self.SERIES_STORE_SIZE:
+                self._series_store.popitem(last=False)
+
+    def _select_countries(self, series, alpha3_codes):
+        """Get data points of the series that belong to given countries.
+
+        Args:
+            series: IndicatorSeries with iso2 country ids.
+            alpha3_codes: set of upper case alpha3 codes or None for all
+                countries.
+        """
+        if alpha3_codes is None or not len(series.country_ids):
+            return series
+        allowed = np.array([
+            code
+            for country in self.get_countries()
+            if country.get("id", "").upper() in alpha3_codes
+            for code in (country.get("iso2Code"), country.get("id"))
+            if code
+        ], dtype=str)
+        country_ids = np.char.upper(series.country_ids.astype(str))
+        return series.take(np.isin(country_ids, np.char.upper(allowed)))
+
+    def _estimate_query(self, batches, batch_sizes, indicator_batches,
+                        points=POINTS_PER_COUNTRY):
+        pages = sum(
+            max(1, -(-indicators * size * points // self.PER_PAGE))
+            for indicators in indicator_batches
+            for size in batch_sizes
+        )
+        size = sum(indicator_batches) * sum(batch_sizes) * (
+            points * BYTES_PER_POINT)
+        cost = pages * REQUEST_COST + size / BANDWIDTH
+        return QueryPlan(batches, pages, size, cost)
+
+    def _plan_query(self, alpha3_codes, indicator_batches=(1,),
+                    points=POINTS_PER_COUNTRY):
+        """Choose how to request indicator data for the given countries.
+
+        Data can be requested for all countries and filtered locally, or for
+        an explicit list of countries, split into batches so that urls stay
+        shorter than MAX_URL_LENGTH. Both options are estimated and the
+        cheaper one is used. On equal cost all countries are requested,
+        because that data can be reused for any later country selection.
+
+        Args:
+            alpha3_codes: set of upper case alpha3 codes or None for all
+                countries.
+            indicator_batches: sizes of indicator batches that will be
+                requested.
+            points: estimated number of data points per country.
+
+        Returns:
+            QueryPlan of the cheaper option.
+        """
+        all_plan = self._estimate_query(
+            ["all"], [len(self.get_countries())], indicator_batches, points)
+        if alpha3_codes is None:
+            return all_plan
+
+        query_length = len(urllib.parse.urljoin(
+            self.BASE_URL,
+            self.BATCH_QUERY.format(countries="", indicators="", source=""),
+        )) + MAX_BATCH_TEXT + 96  # room for source, period and page
+        batch_size = max((MAX_URL_LENGTH - query_length) // 4, 1)
+        codes = sorted(alpha3_codes)
+        batches = [codes[i:i + batch_size]
+                   for i in range(0, len(codes), batch_size)]
+        list_plan = self._estimate_query(
+            [";".join(batch) for batch in batches],
+            [len(batch) for batch in batches],
+            indicator_batches,
+            points,
+        )
+
+        plan = all_plan if all_plan.cost <= list_plan.cost else list_plan
+        logger.info(
+            "Query plan for %d countries and %d indicators: all countries "
+            "%d requests %.1f MB %.1f s, country list %d requests %.1f MB "
+            "%.1f s, using %s", len(codes), sum(indicator_batches),
+            all_plan.pages,
+            all_plan.size / 1e6, all_plan.cost, list_plan.pages,
+            list_plan.size / 1e6, list_plan.cost,
+            "all countries" if plan is all_plan else "country list",
+        )
+        return plan
+
+    def _get_series(self, indicator_ids, alpha3_codes, request,
+                    period=("", POINTS_PER_COUNTRY)):
+        """Get series for all indicators, fetching only missing data.
+
+        Data already stored for an indicator is reused and only countries that
+        are not stored yet are fetched, using the cheaper query plan.
+        Indicators that miss the same countries are fetched in batches, see
+        _batch_indicators. All indicator and country batches of a query plan
+        are fetched concurrently. Fetched data is merged into the store.
+
+        Args:
+            indicator_ids: list of lower case indicator ids.
+            alpha3_codes: frozenset of upper case alpha3 codes or None for all
+                countries.
+            request: FetchRequest for progress and cancellation.
+            period: tuple of period url parameters and estimated data points
+                per country, see _get_period.
+
+        Returns:
+            dict of IndicatorSeries with data for the requested countries.
+        """
+        observer = request.observer
+        params, points = period
+        stored = {}
+        ready = []
+        groups = collections.OrderedDict()
+        for indicator in indicator_ids:
+            stored[indicator] = self._get_stored_series((indicator, params))
+            stored_codes = stored[indicator] and stored[indicator][0]
+            if stored[indicator] is None:
+                missing = alpha3_codes
+            elif stored_codes is None:
+                ready.append(indicator)
+                continue
+            elif alpha3_codes is None:
+                missing = None
+            else:
+                missing = alpha3_codes - stored_codes
+                if not missing:
+                    ready.append(indicator)
+                    continue
+            groups.setdefault(missing, []).append(indicator)
+
+        plans = []
+        for missing, group in groups.items():
+            indicator_batches = self._batch_indicators(group)
+            plans.append((indicator_batches, self._plan_query(
+                missing, [len(batch) for batch in indicator_batches], points)))
+        observer.add_units(len(ready) + sum(
+            len(indicator_batches) * len(plan.batches)
+            for indicator_batches, plan in plans))
+        for indicator in ready:
+            observer.unit_done(indicator)
+
+        for indicator_batches, plan in plans:
+            fetched = collections.defaultdict(list)
+            fetched_codes = collections.defaultdict(set)
+            data = {}
+            queries = []
+            for alpha3_text in plan.batches:
+                data[alpha3_text] = {}
+                missing_batches = []
+                for batch in indicator_batches:
+                    for indicator in batch:
+                        cached = self._get_cached_series(
+                            alpha3_text, indicator, params)
+                        if cached is not None:
+                            data[alpha3_text][indicator] = cached
+                    missing_batch = tuple(
+                        i for i in batch if i not in data[alpha3_text])
+                    if missing_batch:
+                        missing_batches.append(missing_batch)
+                    else:
+                        observer.unit_done((batch, alpha3_text))
+                if missing_batches:
+                    queries.append((alpha3_text, missing_batches))
+            request.check_cancelled()
+            logger.debug("Fetching %s for countries %s",
+                         indicator_batches, plan.batches)
+            for alpha3_text, series_data in self._fetch_indicators(
+                    queries, request, params).items():
+                data[alpha3_text].update(series_data)
+            for alpha3_text in plan.batches:
+                for indicator, series in data[alpha3_text].items():
+                    fetched[indicator].append(series)
+                    fetched_codes[indicator].update(alpha3_text.split(";"))
+
+            for indicator, series_list in fetched.items():
+                codes = None
+                if plan.batches != ["all"]:
+                    codes = frozenset(fetched_codes[indicator])
+                if stored[indicator] is not None and codes is not None:
+                    stored_codes, stored_series = stored[indicator]
+                    series_list.insert(0, stored_series)
+                    codes = codes | stored_codes
+                series = IndicatorSeries.concatenate(series_list)
+                stored[indicator] = (codes, series)
+                self._store_series((indicator, params), codes, series)
+
+        return {
+            indicator: self._select_countries(item[1], alpha3_codes)
+            for indicator, item in stored.items() if item is not None
+        }
+
+    def get_dataset(self, indicators, countries=None, request=None,
+                    date=None, mrv=None):
+        """Get indicator dataset.
+
+        Series are kept per indicator and period between calls, so when the
+        selection of indicators or countries changes, only added indicators
+        and countries are fetched. The period is passed to the server, so
+        only data points inside it are transferred.
+
+        Args:
+            indicators (str or list[str]): A single indicator id, or a list of
+                requested indicator ids.
+            countries (str or list[str]): country id or list of country ids. If
+                None, all countries will be used.
+            request (FetchRequest): optional handle for progress, timing and
+                cancellation of this call. FetchCancelled is raised when the
+                request is cancelled.
+            date (tuple[int]): optional first and last year of requested data.
+            mrv (int): optional number of most recent values per country.
+
+        Returns:
+            IndicatorDataset: all datasets for the requested indicators, in the
+                same order as requested.
+        """
+        if request is None:
+            request = FetchRequest()
+        if isinstance(indicators, str):
+            indicators = [indicators]
+
+        alpha3_codes = self._countries_to_alpha3(countries)
+        if alpha3_codes:
+            alpha3_codes = frozenset(code.upper() for code in alpha3_codes)
+        else:
+            alpha3_codes = None
+
+        indicator_ids = list(collections.OrderedDict.fromkeys(
+            indicator.lower() for indicator in indicators))
+
+        with request:
+            series = self._get_series(indicator_ids, alpha3_codes, request,
+                                      self._get_period(date, mrv))
+
+        responses = collections.OrderedDict(
+            (indicator, series[indicator])
+            for indicator in indicator_ids if indicator in series
+        )
+        return self._dataset_class(responses, self.get_countries())
 
 
 class ClimateDataset(simple_wbd.ClimateDataset):
@@ -180,6 +1181,37 @@ class ClimateDataset(simple_wbd.ClimateDataset):
     """
 
 
+    def _clean_string_columns(self, array, use_dates=False, use_names=False):
+        """Turn first column and row into strings.
+
+        This replaces the original function, which builds a new alpha3 to
+        country name map for every table, with one that uses the shared
+        lookup from countries.get_alpha3_map.
+        """
+        alpha3_map = countries.get_alpha3_map()
+        country_row_index = -1
+        if "country" in self.rows and use_names:
+            country_row_index = self.rows.index("country")
+        country_column_index = -1
+        if "country" in self.columns and use_names:
+            country_column_index = self.columns.index("country")
+
+        array[0][0] = self._join(array[0][0])
+        for row in array[1:]:
+            if use_dates and row[0][0] == "year":
+                row[0] = datetime.date(row[0][1], 1, 1)
+                continue
+            if country_row_index > -1:
+                code = row[0][country_row_index]
+                row[0][country_row_index] = alpha3_map.get(code, code)
+            row[0] = self._join(row[0])
+        for i in range(1, len(array[0])):
+            if country_column_index > -1:
+                code = array[0][i][country_column_index]
+                array[0][i][country_column_index] = alpha3_map.get(code, code)
+            array[0][i] = self._join(array[0][i])
+        return array
+
     def as_np_array(self, **kwargs):
         """Get a 2D numpy array data representation.
 
@@ -196,11 +1228,8 @@ class ClimateDataset(simple_wbd.ClimateDataset):
         data = self.as_np_array(**kwargs)
         if data.shape[0] < 2:
             return None
-        alpha3_map = countries.get_alpha3_map()
-        meta_columns = data[1:, :1]
+        meta_columns = countries.alpha3_to_names(data[1:, :1])
         data_columns = data[1:, 1:]
-        for row in meta_columns:
-            row[0] = alpha3_map.get(row[0], row[0])
 
         meta_domains = [Orange.data.StringVariable(name)
                         for name in data[0, :1]]
@@ -217,12 +1246,10 @@ class ClimateDataset(simple_wbd.ClimateDataset):
                                 **kwargs)
         if data.shape[0] < 2:
             return None
-        alpha3_map = countries.get_alpha3_map()
-        meta_columns = [[time.mktime(date_.timetuple()) if date_ else None]
-                        for date_ in data[1:, 0]]
+        periods = [date_.year if isinstance(date_, datetime.date) else date_
+                   for date_ in data[1:, 0]]
+        meta_columns = parse_periods(periods)[:, np.newaxis]
         data_columns = data[1:, 1:]
-        for row in meta_columns:
-            row[0] = alpha3_map.get(row[0], row[0])
 
         meta_domains = [Orange.data.TimeVariable(name)
                         for name in data[0, :1]]
@@ -242,10 +1269,199 @@ class ClimateDataset(simple_wbd.ClimateDataset):
 
 
 class ClimateAPI(simple_wbd.ClimateAPI):
-    """Wrapper for Climate API to use the extended data set."""
+    """Wrapper for Climate API to use the extended data set.
+
+    Every combination of location, data type and interval is a separate
+    query. Queries are fetched concurrently with a bounded pool of worker
+    threads, and failed queries are retried. Responses are stored per query,
+    so a selection that overlaps an earlier one only fetches new queries.
+
+    Args:
+        data_cache: Optional DatasetCache used for storing query responses.
+        max_workers: Maximum number of concurrent requests.
+        retries: Number of extra attempts for a failed query.
+    """
     # pylint: disable=too-few-public-methods
     # This is just an extension of the returned dataset. We do not need to add
     # any additional functions here.
 
-    def __init__(self):
+    def __init__(self, data_cache=None, max_workers=MAX_WORKERS,
+                 retries=CLIMATE_RETRIES):
         super().__init__(ClimateDataset)
+        self.data_cache = data_cache
+        self.max_workers = max_workers
+        self.retries = retries
+
+    @staticmethod
+    def _get_cache_key(url):
+        # The query url contains location type, location, data type and
+        # interval, and nothing else.
+        return cache.make_key("climate", url)
+
+    def _get_cached_response(self, url):
+        if self.data_cache is None:
+            return None
+        arrays = self.data_cache.get(self._get_cache_key(url))
+        if arrays is None:
+            return None
+        logger.debug("Using cached climate data for %s", url)
+        return json.loads(arrays["response"].tobytes().decode("utf-8"))
+
+    def _set_cached_response(self, url, response):
+        if self.data_cache is not None:
+            text = json.dumps(response).encode("utf-8")
+            self.data_cache.put(self._get_cache_key(url), {
+                "response": np.frombuffer(text, dtype=np.uint8),
+            })
+
+    def _fetch_instrumental(self, url, request):
+        """Fetch a single climate query, retrying on failure.
+
+        Returns:
+            parsed JSON response.
+        """
+        for attempt in range(self.retries + 1):
+            request.check_cancelled()
+            try:
+                return json.loads(transport.fetch(url))
+            except Exception:  # pylint: disable=broad-except
+                # Any error from the connection or an invalid response.
+                if attempt == self.retries:
+                    raise
+                logger.info("Retrying climate query %s", url, exc_info=True)
+                request.sleep(RETRY_DELAY * 2 ** attempt)
+
+    @staticmethod
+    def _decade_averages(response):
+        """Compute decade averages from a yearly climate response.
+
+        Decades start with years divisible by ten, same as decades returned
+        by the API, and only years with a value are averaged. Partial decades
+        at the ends of a series are averaged over the years they contain, so
+        the first decade of a series that starts in 1901 covers only nine
+        years. Values are expected to match the server's decade response for
+        the same series up to float rounding. This could not be checked
+        against recorded server responses because the climate API was not
+        reachable when this was written.
+
+        Args:
+            response: list of dicts with "year" and "data" keys.
+
+        Returns:
+            list of dicts with decade start "year" and average "data".
+        """
+        items = [item for item in response or []
+                 if item.get("data") is not None]
+        years = np.array([item["year"] for item in items], dtype=int)
+        values = np.array([item["data"] for item in items], dtype=float)
+        mask = ~np.isnan(values)
+        decades, inverse = np.unique(years[mask] // 10 * 10,
+                                     return_inverse=True)
+        means = (np.bincount(inverse, weights=values[mask]) /
+                 np.bincount(inverse))
+        return [{"year": int(decade), "data": float(mean)}
+                for decade, mean in zip(decades, means)]
+
+    def get_instrumental(self, locations, data_types=None, intervals=None,
+                         request=None, derive_decades=False):
+        """Get historical data for temperature or precipitation.
+
+        See simple_wbd.ClimateAPI.get_instrumental. This version uses the
+        shared transport, reuses cached query responses and fetches the
+        remaining queries concurrently. Progress is
+        reported to the optional FetchRequest per finished query, and the
+        request can also be used for cancelling the call, in which case
+        FetchCancelled is raised. Queries that fail on all attempts are left
+        out of the dataset. The dataset does not depend on the order in which
+        queries finish.
+
+        If derive_decades is set, decade averages are computed from yearly
+        data instead of being fetched, so selecting both intervals needs one
+        query per location and data type instead of two. Monthly data is a
+        climatology of 12 values and is always fetched.
+        """
+        if request is None:
+            request = FetchRequest()
+        if not data_types:
+            data_types = self.INSTRUMENTAL_TYPES
+        if not intervals:
+            intervals = self._default_intervals
+        requested_intervals = list(intervals)
+        derive_decades = derive_decades and "decade" in requested_intervals
+        if derive_decades:
+            intervals = [interval for interval in requested_intervals
+                         if interval not in ("year", "decade")] + ["year"]
+
+        parameters = list(itertools.product(locations, data_types, intervals))
+        observer = request.observer
+        observer.add_units(len(parameters))
+        responses = {}
+        with request:
+            executor = futures.ThreadPoolExecutor(self.max_workers)
+            pending = {}
+            try:
+                for parameter in parameters:
+                    location, data_type, interval = parameter
+                    loc_type, location = self._get_location(location)
+                    query = self.INSTRUMENTAL_QUERY.format(
+                        loc_type=loc_type,
+                        data_type=data_type,
+                        interval=interval,
+                        location=location,
+                    )
+                    url = self.BASE_URL + query
+                    cached = self._get_cached_response(url)
+                    if cached is not None:
+                        responses[parameter] = (location, url, cached)
+                        observer.unit_done(parameter)
+                        continue
+                    future = executor.submit(self._fetch_instrumental, url,
+                                             request)
+                    pending[future] = (parameter, location, url)
+                while pending:
+                    finished, _ = futures.wait(
+                        pending, timeout=CANCEL_POLL_INTERVAL,
+                        return_when=futures.FIRST_COMPLETED)
+                    request.check_cancelled()
+                    for future in finished:
+                        parameter, location, url = pending.pop(future)
+                        try:
+                            response = future.result()
+                            responses[parameter] = (location, url, response)
+                            self._set_cached_response(url, response)
+                            observer.page_done(parameter, 1)
+                        except Exception:  # pylint: disable=broad-except
+                            logger.warning("Failed to fetch climate data: %s",
+                                           url, exc_info=True)
+                        observer.unit_done(parameter)
+            finally:
+                for future in pending:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+        api_responses = collections.defaultdict(
+            lambda: collections.defaultdict(dict))
+        for parameter in parameters:
+            if parameter not in responses:
+                continue
+            _, data_type, interval = parameter
+            location, url, response = responses[parameter]
+            api_responses[location][data_type][interval] = {
+                "url": url,
+                "response": response,
+            }
+
+        if derive_decades:
+            for type_responses in api_responses.values():
+                for interval_responses in type_responses.values():
+                    if "year" not in interval_responses:
+                        continue
+                    year = interval_responses["year"]
+                    interval_responses["decade"] = {
+                        "url": year["url"],
+                        "response": self._decade_averages(year["response"]),
+                    }
+                    if "year" not in requested_intervals:
+                        del interval_responses["year"]
+
+        return self._dataset_class(api_responses)
@@ -0,0 +1,163 @@
+"""Persistent cache for fetched World Bank data.
+
+Parsed API data is stored as compressed numpy arrays in a local SQLite
+database, so the same data does not have to be downloaded again in the same
+or in a later Orange session. Entries expire after a configurable time and
+the least recently used entries are removed when the cache grows over its
+size limit.
+"""
+
+import io
+import contextlib
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+import numpy as np
+from Orange.misc import environ
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 60 * 60 * 24  # one day in seconds
+CACHE_MAX_SIZE = 200 * 1024 * 1024  # 200 MB
+CACHE_DIR_NAME = "orange3-datasets"
+CACHE_FILE_NAME = "datasets_cache.sqlite"
+
+# Climate data is historical and changes very rarely, so it is kept longer
+# and in a separate file, where indicator entries can not evict it.
+CLIMATE_CACHE_TTL = 60 * 60 * 24 * 30  # thirty days in seconds
+CLIMATE_CACHE_FILE_NAME = "climate_cache.sqlite"
+
+
+def get_cache_dir():
+    """Get the add-on cache directory and create it if it does not exist."""
+    cache_dir = os.path.join(environ.cache_dir(), CACHE_DIR_NAME)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+        logger.debug("Created cache directory: %s", cache_dir)
+    return cache_dir
+
+
+def make_key(*parts):
+    """Create a cache key from json serializable parts."""
+    text = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DatasetCache(object):
+    """SQLite backed cache of named numpy arrays.
+
+    Args:
+        path: Path to the SQLite file. Defaults to a file in the Orange cache
+            directory.
+        ttl: Number of seconds before an entry expires.
+        max_size: Maximum total size of stored entries in bytes. When the
+            limit is exceeded, least recently used entries are removed.
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_size=CACHE_MAX_SIZE):
+        if path is None:
+            path = os.path.join(get_cache_dir(), CACHE_FILE_NAME)
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "  key TEXT PRIMARY KEY,"
+                "  data BLOB NOT NULL,"
+                "  size INTEGER NOT NULL,"
+                "  created REAL NOT NULL,"
+                "  accessed REAL NOT NULL"
+                ")"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _dumps(arrays):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _loads(data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def get(self, key):
+        """Get stored arrays for the given key.
+
+        Returns:
+            dict of numpy arrays or None if the key is missing or expired.
+        """
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT data, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                logger.debug("Removing expired cache entry %s", key)
+                connection.execute("DELETE FROM entries WHERE key = ?",
+                                   (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return self._loads(row[0])
+
+    def put(self, key, arrays):
+        """Store a dict of numpy arrays under the given key."""
+        data = self._dumps(arrays)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), len(data), now, now),
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection, now):
+        """Remove expired entries and entries over the size limit."""
+        connection.execute("DELETE FROM entries WHERE created < ?",
+                           (now - self.ttl,))
+        total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = connection.execute(
+            "SELECT key, size FROM entries ORDER BY accessed").fetchall()
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            logger.debug("Evicted cache entry %s", key)
+
+    def clear(self):
+        """Remove all cache entries."""
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+
+    @property
+    def stats(self):
+        """Get cache hit and miss counts."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -3,19 +3,33 @@
 This module has all the helper functions for generating proper structures for
 CountryTreeWidget.
 
-The three main exposed functions are:
+The main exposed functions are:
     get_countries_dict - Used in climate widget.
     get_countries_regions_dict - Used in indicator widget.
     get_alpha3_map - used for changing alpha3 codes to country names.
+    alpha3_to_names - vectorized get_alpha3_map lookup for array columns.
+    get_catalog - indexed list of all indicator API countries and regions.
 """
+import os
 import copy
+import json
+import time
+import types
 import logging
+import urllib
+import functools
+import threading
 from collections import defaultdict
 from collections import OrderedDict
 
+import numpy as np
 import pycountry
 import simple_wbd
 
+from orangecontrib.datasets import cache
+from orangecontrib.datasets import snapshot
+from orangecontrib.datasets import transport
+
 logger = logging.getLogger(__name__)
 
 MAPPINGS = {
@@ -395,6 +409,10 @@ DATA_STRUCTURE = [
     ("Countries", []),
 ]
 
+CATALOG_TTL = 60 * 60 * 24 * 7  # one week in seconds
+CATALOG_FILE_NAME = "country_catalog.json"
+CATALOG_RETRY_DELAY = 60 * 10  # ten minutes between failed refreshes
+
 RENAME_MAP = {
     "SST": "All small states",
     "EMU": "High Income Euro area",
@@ -405,23 +423,69 @@ def _order_countries_dict(countries):
     return OrderedDict(sorted(countries.items(), key=lambda x: x[1]["name"]))
 
 
+@functools.lru_cache(maxsize=1)
+def _get_pycountry_alpha3():
+    """Get an immutable mapping from pycountry names to alpha3 codes.
+
+    Older pycountry versions name the code attribute alpha3 and newer ones
+    alpha_3.
+    """
+    alpha_map = {}
+    for country in pycountry.countries:
+        code = getattr(country, "alpha_3", None) or getattr(
+            country, "alpha3", None)
+        if code and hasattr(country, "name"):
+            alpha_map[country.name] = code
+    return types.MappingProxyType(alpha_map)
+
+
+@functools.lru_cache(maxsize=1)
 def get_alpha3_map():
-    """Get mappings from alpha3 codes to country names."""
+    """Get mappings from alpha3 codes to country names.
+
+    The mapping is built once per process and can not be modified.
+    """
     name_map = {v: k for k, v in MAPPINGS.items()}
-    return {c.alpha3: name_map.get(c.name, c.name)
-            for c in pycountry.countries}
+    return types.MappingProxyType({
+        code: name_map.get(name, name)
+        for name, code in _get_pycountry_alpha3().items()
+    })
+
+
+def alpha3_to_names(codes):
+    """Replace alpha3 codes in an array with country names.
+
+    Each distinct code is looked up only once. Values that are not known
+    alpha3 codes are kept.
+
+    Args:
+        codes: array of alpha3 codes of any shape.
+
+    Returns:
+        object array of the same shape with country names.
+    """
+    codes = np.asarray(codes, dtype=object)
+    if not codes.size:
+        return codes.copy()
+    alpha3_map = get_alpha3_map()
+    unique_codes, inverse = np.unique(codes.astype(str), return_inverse=True)
+    names = np.array([alpha3_map.get(code, code) for code in unique_codes],
+                     dtype=object)
+    return names[inverse.ravel()].reshape(codes.shape)
 
 
 def get_countries_dict():
     """Get a dict of all all country codes and names grouped by continent."""
     result = defaultdict(dict)
-    alpha_map = {c.name: c.alpha3 for c in pycountry.countries if hasattr(c, "name") and hasattr(c, "alpha3")}
+    alpha_map = _get_pycountry_alpha3()
     if len(alpha_map) > 0:
         for continent, countries in COUNTRIES.items():
             for country in countries:
-                result[continent][alpha_map[MAPPINGS.get(country, country)]] = {
-                    "name": country
-                }
+                code = alpha_map.get(MAPPINGS.get(country, country))
+                if code is None:
+                    logger.debug("No alpha3 code for %s", country)
+                    continue
+                result[continent][code] = {"name": country}
         result = {k: _order_countries_dict(v) for k, v in result.items()}
         ordered_result = OrderedDict(sorted(result.items(), key=lambda t: t[0]))
         return ordered_result
@@ -429,6 +493,178 @@ def get_countries_dict():
         return None
 
 
+def _get_countries():
+    """Get a list of countries and regions from the indicator API."""
+    url = urllib.parse.urljoin(simple_wbd.IndicatorAPI.BASE_URL,
+                               "countries" + simple_wbd.IndicatorAPI.GET_PARAMS)
+    return json.loads(transport.fetch(url))[1]
+
+
+class CountryCatalog(object):
+    """Indexed list of countries and regions from the indicator API.
+
+    Args:
+        countries: list of country dicts as returned by the indicator API.
+        timestamp: time when the list was fetched from the API.
+    """
+
+    _text_fields = ["region", "adminregion", "incomeLevel", "lendingType"]
+
+    def __init__(self, countries, timestamp=None):
+        self.countries = countries
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+        for country in countries:
+            for key in self._text_fields:
+                country[key + "_text"] = "{value} ({id_})".format(
+                    value=country.get(key, {}).get("value"),
+                    id_=country.get(key, {}).get("id"),
+                )
+
+        self.by_id = OrderedDict((c["id"], c) for c in countries)
+        self.aggregate_ids = sorted(
+            c["id"] for c in countries
+            if c.get("region", {}).get("value") == "Aggregates"
+        )
+        self.country_ids = sorted(
+            c["id"] for c in countries
+            if c.get("region", {}).get("value") != "Aggregates"
+        )
+
+        # map of lower case names, alpha2 and alpha3 codes to alpha3 codes.
+        self.alpha3_map = {}
+        for field in ["iso2Code", "id", "name"]:
+            self.alpha3_map.update({
+                c.get(field).lower(): c.get("id").lower()
+                for c in countries if c.get(field)
+            })
+
+    @property
+    def is_stale(self):
+        """Check if the catalog should be fetched again."""
+        return time.time() - self.timestamp > CATALOG_TTL
+
+    @staticmethod
+    def get_path():
+        """Get path of the stored catalog."""
+        return os.path.join(cache.get_cache_dir(), CATALOG_FILE_NAME)
+
+    @classmethod
+    def fetch(cls):
+        """Fetch the catalog from the indicator API and store it to disk."""
+        catalog = cls(_get_countries())
+        catalog.save()
+        return catalog
+
+    @classmethod
+    def from_snapshot(cls):
+        """Get the catalog from the bundled snapshot.
+
+        The snapshot catalog is always stale, so that it is refreshed as soon
+        as the API is reachable.
+
+        Returns:
+            CountryCatalog or None if there is no bundled snapshot.
+        """
+        countries = snapshot.get_countries()
+        if countries is None:
+            return None
+        return cls(countries, timestamp=0)
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a stored catalog.
+
+        Returns:
+            CountryCatalog or None if there is no valid stored catalog.
+        """
+        path = path or cls.get_path()
+        try:
+            with open(path, encoding="utf-8") as catalog_file:
+                data = json.load(catalog_file)
+            return cls(data["countries"], timestamp=data["timestamp"])
+        except (OSError, ValueError, KeyError):
+            logger.debug("No valid country catalog in %s", path)
+            return None
+
+    def save(self, path=None):
+        """Store catalog to disk."""
+        path = path or self.get_path()
+        temp_path = "{}.{}".format(path, threading.get_ident())
+        with open(temp_path, "w", encoding="utf-8") as catalog_file:
+            json.dump({"timestamp": self.timestamp,
+                       "countries": self.countries}, catalog_file)
+        os.replace(temp_path, path)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_revalidate_thread = None
+_revalidate_failed = 0  # time of the last failed refresh
+
+
+def _revalidate_catalog():
+    """Fetch a fresh catalog and replace the current one."""
+    # pylint: disable=global-statement
+    global _catalog, _revalidate_failed
+    try:
+        catalog = CountryCatalog.fetch()
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Failed to refresh country catalog.", exc_info=True)
+        with _catalog_lock:
+            _revalidate_failed = time.time()
+        return
+    with _catalog_lock:
+        _catalog = catalog
+
+
+def get_catalog(refresh=False, stored_only=False):
+    """Get the country catalog.
+
+    The catalog is fetched only once per process and stored to disk. A stored
+    catalog, or the bundled snapshot if nothing is stored, is used without
+    waiting for the network. If it is older than CATALOG_TTL it is refreshed
+    in a background thread and the next call returns the refreshed catalog.
+    After a failed refresh the next one is started only after
+    CATALOG_RETRY_DELAY, so that calls without network access do not retry
+    it every time.
+
+    Args:
+        refresh: Fetch a new catalog and wait for the result.
+        stored_only: Never use the network. Returns None if there is no
+            catalog in memory, on disk or in the snapshot.
+
+    Returns:
+        CountryCatalog
+    """
+    # pylint: disable=global-statement
+    global _catalog, _revalidate_thread
+    if refresh:
+        _revalidate_catalog()
+
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CountryCatalog.load() or CountryCatalog.from_snapshot()
+        catalog = _catalog
+
+    if stored_only:
+        return catalog
+
+    if catalog is None:
+        catalog = CountryCatalog.fetch()
+        with _catalog_lock:
+            _catalog = catalog
+    elif catalog.is_stale and not refresh:
+        with _catalog_lock:
+            retry = time.time() - _revalidate_failed >= CATALOG_RETRY_DELAY
+            if retry and (_revalidate_thread is None or
+                          not _revalidate_thread.is_alive()):
+                _revalidate_thread = threading.Thread(
+                    target=_revalidate_catalog, daemon=True)
+                _revalidate_thread.start()
+    return catalog
+
+
 def _gather_used_ids(items):
     ids = set()
     for item in items:
@@ -439,55 +675,37 @@ def _gather_used_ids(items):
     return ids
 
 
-def _add_missing_aggregates(data):
+def _add_missing_aggregates(data, catalog):
     """Add any missing aggregates to data.
 
     The data structure might be missing any newly added aggregates from the
     API. This function will add all of those under the other section of
     aggregates list.
     """
-    api = simple_wbd.IndicatorAPI()
-    countries = api.get_countries()
-    aggregate_codes = set(
-        [i.get("id") for i in countries if
-         i.get("region", {}).get("value") == "Aggregates"]
-    )
     used_codes = _gather_used_ids(data)
-    missing_aggregates = aggregate_codes.difference(used_codes)
+    missing_aggregates = set(catalog.aggregate_ids).difference(used_codes)
     for code in sorted(missing_aggregates):
         # 0,1 = Aggregates, 2,1 = Other
         data[0][1][2][1].append(code)
     return data
 
 
-def _add_missing_countries(data):
+def _add_missing_countries(data, catalog):
     """Add all countries from the API to country data."""
-    api = simple_wbd.IndicatorAPI()
-    countries = api.get_countries()
-    country_codes = set(
-        [i.get("id") for i in countries if
-         i.get("region", {}).get("value") != "Aggregates"]
-    )
-    for code in sorted(country_codes):
+    for code in catalog.country_ids:
         # 1,1 = Countries
         data[1][1].append(code)
     return data
 
 
-def _generate_country_map():
-    api = simple_wbd.IndicatorAPI()
-    countries = api.get_countries()
-    return {c["id"]: c for c in countries}
-
-
-def _generate_country_dict(data):
+def _generate_country_dict(data, country_map):
     """Turn the country and region structure into an ordered dict."""
-    country_map = _generate_country_map()
     country_dict = OrderedDict()
 
     for item in data:
         if isinstance(item, tuple):
-            country_dict[item[0]] = _generate_country_dict(item[1])
+            country_dict[item[0]] = _generate_country_dict(item[1],
+                                                           country_map)
         elif item in country_map:
             country_dict[item] = country_map[item]
         else:
@@ -495,9 +713,15 @@ def _generate_country_dict(data):
     return country_dict
 
 
-def get_countries_regions_dict():
-    """Get country and region data for indicators widget."""
+def get_countries_regions_dict(catalog=None):
+    """Get country and region data for indicators widget.
+
+    Args:
+        catalog: CountryCatalog to use. Defaults to get_catalog().
+    """
+    if catalog is None:
+        catalog = get_catalog()
     data = copy.deepcopy(DATA_STRUCTURE)
-    data = _add_missing_aggregates(data)
-    data = _add_missing_countries(data)
-    return _generate_country_dict(data)
+    data = _add_missing_aggregates(data, catalog)
+    data = _add_missing_countries(data, catalog)
+    return _generate_country_dict(data, catalog.by_id)
@@ -3,7 +3,6 @@
 import collections
 import logging
 
-import simple_wbd
 from AnyQt import QtCore, QtWidgets
 
 from orangecontrib.datasets import countries
@@ -31,7 +30,6 @@ class CountryTreeWidget(QtWidgets.QTreeWidget):
         self._commit_callback = commit_callback
         self._selection_list = selection_list
         self._busy = False
-        self._api = simple_wbd.IndicatorAPI()
         self._init_view()
         self._init_listeners()
 
@@ -2,58 +2,381 @@
 
 import textwrap
 import logging
+import itertools
+import collections
 from functools import partial
-from functools import lru_cache
 
-import simple_wbd
-from AnyQt.QtCore import Qt, QThread, QCoreApplication
-from AnyQt import QtGui, QtCore, QtWidgets
+import numpy as np
+from AnyQt.QtCore import Qt
+from AnyQt import QtCore, QtWidgets
 from Orange.widgets import gui
 from Orange.widgets.utils import concurrent
 
+from orangecontrib.datasets import api_wrapper
+
 TEXTFILTERROLE = next(gui.OrangeUserRole)
 logger = logging.getLogger(__name__)
 
 
+class NgramIndex(object):
+    """Inverted trigram index over a list of strings.
+
+    For every trigram the index stores a sorted array of rows that contain it.
+    Token lookups intersect the row arrays of all token trigrams and then
+    check only the remaining candidate rows.
+
+    Args:
+        texts: list of strings to index.
+    """
+
+    N = 3
+    _BITS = 21  # enough for any unicode code point
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+        count = len(self.texts)
+        lengths = np.fromiter((len(t) for t in self.texts), dtype=np.int64,
+                              count=count)
+        # Zero code points separate texts so that no trigram spans two rows.
+        codes = self._codes("\0".join(self.texts) + "\0")
+        rows = np.repeat(np.arange(count), lengths + 1)
+
+        grams = self._grams(codes)
+        valid = np.ones(len(grams), dtype=bool)
+        for offset in range(self.N):
+            valid &= codes[offset:len(codes) - self.N + 1 + offset] != 0
+        grams, rows = grams[valid], rows[:len(valid)][valid]
+
+        # sort by trigram and row and remove duplicate pairs
+        order = np.lexsort((rows, grams))
+        grams, rows = grams[order], rows[order]
+        unique = np.ones(len(grams), dtype=bool)
+        unique[1:] = (grams[1:] != grams[:-1]) | (rows[1:] != rows[:-1])
+        grams, rows = grams[unique], rows[unique]
+
+        self._keys, self._starts = np.unique(grams, return_index=True)
+        self._ends = np.append(self._starts[1:], len(grams))
+        self._postings = rows.astype(np.int32)
+
+    def __len__(self):
+        return len(self.texts)
+
+    @staticmethod
+    def _codes(text):
+        data = text.encode("utf-32-le", errors="surrogatepass")
+        return np.frombuffer(data, dtype=np.uint32).astype(np.int64)
+
+    def _grams(self, codes):
+        """Encode all consecutive code point triplets into single integers."""
+        size = len(codes) - self.N + 1
+        if size <= 0:
+            return np.empty(0, dtype=np.int64)
+        grams = np.zeros(size, dtype=np.int64)
+        for offset in range(self.N):
+            grams = (grams << self._BITS) | codes[offset:offset + size]
+        return grams
+
+    def _gram_rows(self, gram):
+        position = np.searchsorted(self._keys, gram)
+        if position < len(self._keys) and self._keys[position] == gram:
+            return self._postings[self._starts[position]:
+                                  self._ends[position]]
+        return np.empty(0, dtype=np.int32)
+
+    def candidates(self, token):
+        """Get rows that contain all trigrams of the given token.
+
+        Returns:
+            Sorted array of row indexes or None if the token is too short to
+            be looked up in the index.
+        """
+        if len(token) < self.N:
+            return None
+        rows = None
+        for gram in np.unique(self._grams(self._codes(token))):
+            gram_rows = self._gram_rows(gram)
+            if rows is None:
+                rows = gram_rows
+            else:
+                rows = np.intersect1d(rows, gram_rows, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+    def match(self, token, rows=None):
+        """Get a boolean mask of rows that contain the given token.
+
+        Args:
+            token: string to search for.
+            rows: optional array of rows that should be checked. All other
+                rows are considered as not matching.
+        """
+        candidates = self.candidates(token)
+        if candidates is None:
+            candidates = rows
+        elif rows is not None:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        if candidates is None:
+            candidates = range(len(self.texts))
+        rows = candidates
+        mask = np.zeros(len(self.texts), dtype=bool)
+        texts = self.texts
+        mask[[row for row in rows if token in texts[row]]] = True
+        return mask
+
+
+def _get_sort_key(values, numeric=False):
+    """Get integer sort ranks for a column of display values.
+
+    Args:
+        values: list of display values.
+        numeric: if True, values such as "GDS123" are compared by their
+            number and are placed before all other values.
+
+    Returns:
+        Array with the position of each row in ascending order.
+    """
+    texts = np.array([str(value) for value in values], dtype=object)
+    numbers = np.zeros(len(texts))
+    is_text = np.ones(len(texts), dtype=bool)
+    if numeric:
+        for row, text in enumerate(texts):
+            try:
+                numbers[row] = int(text.lstrip("GDS"))
+                is_text[row] = False
+            except ValueError:
+                pass
+    _, text_ranks = np.unique(texts, return_inverse=True)
+    order = np.lexsort((text_ranks.ravel(), numbers, is_text))
+    ranks = np.empty(len(texts), dtype=np.int64)
+    ranks[order] = np.arange(len(texts))
+    return ranks
+
+
+class IndicatorTable(object):
+    """Indicator list columns with a prebuilt filter index and sort keys.
+
+    Building the index and the sort keys takes a while for long lists, so the
+    table is built in a background thread and IndicatorTableModel only
+    serves it to the view.
+
+    Args:
+        indicators: list of indicator dicts as returned by the World Bank API.
+    """
+
+    ID_COLUMN = 1
+
+    def __init__(self, indicators=()):
+        self.ids = np.array(
+            [ind.get("id", "").strip() for ind in indicators], dtype=object)
+        self.names = np.array(
+            [ind.get("name", "").strip() for ind in indicators],
+            dtype=object)
+        self.topics = np.array([
+            ", ".join(topic.get("value", "").strip()
+                      for topic in ind.get("topics", []))
+            for ind in indicators
+        ], dtype=object)
+        self.sources = np.array([
+            ind.get("source", {}).get("value", "").strip()
+            for ind in indicators
+        ], dtype=object)
+        self.search_texts = [
+            " | ".join(row).lower() for row in
+            zip(itertools.repeat(""), self.ids, self.names, self.topics,
+                self.sources)
+        ]
+        self.columns = [None, self.ids, self.names, self.topics,
+                        self.sources]
+        self.index = NgramIndex(self.search_texts)
+        self.sort_keys = [
+            _get_sort_key(self.column(column),
+                          numeric=column == self.ID_COLUMN)
+            for column in range(len(self.columns))
+        ]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, column):
+        """Get display values of a column in the original row order."""
+        values = self.columns[column]
+        if values is None:
+            return np.full(len(self.ids), "", dtype=object)
+        return values
+
+
+class IndicatorTableModel(QtCore.QAbstractTableModel):
+    """Read only table model for the list of indicators.
+
+    Cell values are kept in per column arrays and are served lazily by
+    data(), instead of creating an item object for every cell.
+
+    Args:
+        indicators: IndicatorTable or a list of indicator dicts as returned
+            by the World Bank API.
+        parent: parent QObject.
+    """
+    # pylint: disable=invalid-name
+
+    HEADER = ["", "Id", "Name", "Topics", "Source"]
+    LINK = "http://data.worldbank.org/indicator/{}?view=chart"
+
+    def __init__(self, indicators=(), parent=None):
+        super().__init__(parent)
+        if not isinstance(indicators, IndicatorTable):
+            indicators = IndicatorTable(indicators)
+        self.table = indicators
+        self.ids = indicators.ids
+        self.search_texts = indicators.search_texts
+        self._columns = indicators.columns
+        self.row_order = np.arange(len(self.ids))
+
+    def column(self, column):
+        """Get display values of a column in the original row order."""
+        return self.table.column(column)
+
+    def set_row_order(self, order):
+        """Reorder displayed rows.
+
+        Args:
+            order: array with the original row index for each displayed row.
+        """
+        order = np.asarray(order, dtype=np.int64)
+        self.layoutAboutToBeChanged.emit()
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+        old_indexes = self.persistentIndexList()
+        new_indexes = [
+            self.index(int(positions[self.row_order[index.row()]]),
+                       index.column())
+            for index in old_indexes
+        ]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.row_order = order
+        self.layoutChanged.emit()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.ids)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADER)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = self.row_order[index.row()], index.column()
+        if role == Qt.DisplayRole:
+            values = self._columns[column]
+            return "" if values is None else values[row]
+        if role == TEXTFILTERROLE and column == 0:
+            return self.search_texts[row]
+        if role == gui.LinkRole and column == 1:
+            return self.LINK.format(self.ids[row])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADER[section]
+        return None
+
+
 class MySortFilterProxyModel(QtCore.QSortFilterProxyModel):
     """Filter proxy model.
 
-    This class is used for improving filtering of indicators table.
+    This class is used for improving filtering of indicators table. Filter
+    texts of all rows are indexed with NgramIndex when the source model is
+    set, and matches for each filter string are kept as boolean row masks.
+    When a filter string extends a previous one, only rows that matched the
+    shorter string are checked again.
+
+    Sort keys for all columns are computed once when the source model is set.
+    Source models that support set_row_order, such as IndicatorTableModel,
+    are sorted with a single argsort over those keys and the proxy only
+    filters the reordered rows. The index and sort keys of an
+    IndicatorTableModel are taken from its prebuilt IndicatorTable.
     """
     # pylint: disable=invalid-name
     # camel case names are false positives because they must be used to
     # override the original QtGui.QSortFilterProxyModel functions
     # PyQt5: it overrides QtCore.QSortFilterProxyModel
 
+    PREFIX_CACHE_SIZE = 64
+    ID_COLUMN = 1
+
     def __init__(self, parent=None):
         QtCore.QSortFilterProxyModel.__init__(self, parent)
         self._filter_strings = []
         self._cache = {}
-        self._cache_fixed = {}
-        self._cache_prefix = {}
-        self._row_text = {}
-
-        # Create a cached version of _filtered_rows
-        self._filtered_rows_cached = lru_cache(100)(self._filtered_rows)
+        self._cache_fixed = np.ones(0, dtype=bool)
+        self._cache_prefix = collections.OrderedDict()
+        self._index = NgramIndex([])
+        self._sort_keys = []
+        self._order = None
 
     def setSourceModel(self, model):
-        """Set the source model for the filter.
+        """Set the source model for the filter and index its rows.
         """
         self._filter_strings = []
         self._cache = {}
-        self._cache_fixed = {}
-        self._cache_prefix = {}
-        self._row_text = {}
+        self._cache_prefix = collections.OrderedDict()
         QtCore.QSortFilterProxyModel.setSourceModel(self, model)
+        row_count = model.rowCount() if model is not None else 0
+        self._cache_fixed = np.ones(row_count, dtype=bool)
+        self._order = None
+        if hasattr(model, "set_row_order"):
+            self._order = model.row_order
+
+        table = getattr(model, "table", None)
+        if table is not None:
+            # Prebuilt by IndicatorTable, usually in a background thread.
+            self._index = table.index
+            self._sort_keys = table.sort_keys
+            return
+
+        texts = [self.rowFilterText(row) for row in range(row_count)]
+        self._index = NgramIndex(texts)
+        if model is not None:
+            columns = [[model.index(row, column).data(Qt.DisplayRole)
+                        for row in range(row_count)]
+                       for column in range(model.columnCount())]
+        else:
+            columns = []
+        self._sort_keys = [
+            _get_sort_key(values, numeric=column == self.ID_COLUMN)
+            for column, values in enumerate(columns)
+        ]
+
+    def _match(self, string):
+        """Get a row mask for a single filter string.
+
+        If a prefix of the string was matched before, only rows that matched
+        the prefix are checked. Results are kept in a bounded prefix cache.
+        """
+        prefix_cache = self._cache_prefix
+        if string in prefix_cache:
+            prefix_cache.move_to_end(string)
+            return prefix_cache[string]
+
+        rows = None
+        for end in range(len(string) - 1, 0, -1):
+            prefix_mask = prefix_cache.get(string[:end])
+            if prefix_mask is not None:
+                rows = np.flatnonzero(prefix_mask)
+                break
+
+        mask = self._index.match(string, rows=rows)
+        prefix_cache[string] = mask
+        while len(prefix_cache) > self.PREFIX_CACHE_SIZE:
+            prefix_cache.popitem(last=False)
+        return mask
 
     def addFilterFixedString(self, string, invalidate=True):
         """ Add `string` filter to the list of filters. If invalidate is
         True the filter cache will be recomputed.
         """
         self._filter_strings.append(string)
-        all_rows = range(self.sourceModel().rowCount())
-        row_text = [self.rowFilterText(row) for row in all_rows]
-        self._cache[string] = [string in text for text in row_text]
+        self._cache[string] = self._match(string)
         if invalidate:
             self.updateCached()
             self.invalidateFilter()
@@ -84,26 +407,24 @@ class MySortFilterProxyModel(QtCore.QSortFilterProxyModel):
         self.invalidate()
 
     def _filtered_rows(self, filter_strings):
-        """Return a dictionary mapping row indexes to True False values.
-
-        .. note:: This helper function is wrapped in the __init__ method.
-
-        """
-        all_rows = range(self.sourceModel().rowCount())
-        cache = self._cache
-        return dict([(row, all([cache[str][row] for str in filter_strings]))
-                     for row in all_rows])
+        """Return a boolean mask of rows that match all filter strings."""
+        mask = np.ones(len(self._index), dtype=bool)
+        for string in filter_strings:
+            mask &= self._cache[string]
+        return mask
 
     def updateCached(self):
         """Update the combined filter cache.
         """
-        self._cache_fixed = self._filtered_rows_cached(
-            tuple(sorted(self._filter_strings)))
+        mask = self._filtered_rows(self._filter_strings)
+        if self._order is not None:
+            mask = mask[self._order]
+        self._cache_fixed = mask
 
     def setFilterFixedString(self, string):
         """Should this raise an error? It is not being used.
         """
-        QtGui.QSortFilterProxyModel.setFilterFixedString(self, string)
+        QtCore.QSortFilterProxyModel.setFilterFixedString(self, string)
 
     def rowFilterText(self, row):
         """Return text for `row` to filter on.
@@ -115,19 +436,33 @@ class MySortFilterProxyModel(QtCore.QSortFilterProxyModel):
         return str(data)
 
     def filterAcceptsRow(self, row, _):
-        return self._cache_fixed.get(row, True)
+        if row < len(self._cache_fixed):
+            return bool(self._cache_fixed[row])
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort rows by the precomputed keys of the given column."""
+        model = self.sourceModel()
+        if (not hasattr(model, "set_row_order") or
+                not 0 <= column < len(self._sort_keys)):
+            QtCore.QSortFilterProxyModel.sort(self, column, order)
+            return
+
+        keys = self._sort_keys[column]
+        if order == Qt.DescendingOrder:
+            keys = -keys
+        self._order = np.argsort(keys, kind="stable")
+        self.updateCached()
+        # Rows are ordered by the source model, so the proxy keeps its order.
+        QtCore.QSortFilterProxyModel.sort(self, -1)
+        model.set_row_order(self._order)
 
     def lessThan(self, left, right):
-        """Less comparator for columns."""
-        if left.column() == 1 and right.column():
-            left_gds = str(left.data(Qt.DisplayRole))
-            right_gds = str(right.data(Qt.DisplayRole))
-            left_gds = left_gds.lstrip("GDS")
-            right_gds = right_gds.lstrip("GDS")
-            try:
-                return int(left_gds) < int(right_gds)
-            except ValueError:
-                pass
+        """Less comparator for source models without row ordering."""
+        column = left.column()
+        if column < len(self._sort_keys):
+            keys = self._sort_keys[column]
+            return bool(keys[left.row()] < keys[right.row()])
         return QtCore.QSortFilterProxyModel.lessThan(self, left, right)
 
 
@@ -138,8 +473,10 @@ class IndicatorsTreeView(QtWidgets.QTreeView):
         super().__init__(parent)
         self._main_widget = main_widget
         self._fetch_task = None
+        self._refresh_task = None
+        self._restore_ids = None
         self._indicator_data = None
-        self._api = simple_wbd.IndicatorAPI()
+        self._api = api_wrapper.IndicatorAPI()
         self.setAlternatingRowColors(True)
         self.setEditTriggers(QtWidgets.QTreeView.NoEditTriggers)
         self.setRootIsDecorated(False)
@@ -163,19 +500,26 @@ class IndicatorsTreeView(QtWidgets.QTreeView):
         self._executor = concurrent.ThreadExecutor()
         self.fetch_indicators()
 
-    def fetch_indicators(self):
-        """Trigger a background job for fetching a new indicator list."""
+    def fetch_indicators(self, selected_ids=None):
+        """Trigger a background job for fetching a new indicator list.
+
+        Args:
+            selected_ids: optional list of indicator ids that should be
+                selected in the new list.
+        """
+        self._restore_ids = selected_ids
         self._main_widget.setBlocking(True)
-        self._main_widget.setEnabled(False)
+        self.setEnabled(False)
         func = partial(
             self._fetch_indicators,
             concurrent.methodinvoke(
                 self._main_widget, "set_progress", (float,))
         )
-        self._fetch_task = concurrent.Task(function=func)
-        self._fetch_task.finished.connect(self._fetch_indicators_finished)
-        self._fetch_task.exceptionReady.connect(self._init_exception)
-        self._executor.submit(self._fetch_task)
+        task = concurrent.Task(function=func)
+        task.finished.connect(partial(self._fetch_indicators_finished, task))
+        task.exceptionReady.connect(self._init_exception)
+        self._fetch_task = task
+        self._executor.submit(task)
 
     def _get_selected_ids(self):
         return [i.data(Qt.DisplayRole) for i in self.selectedIndexes()
@@ -224,60 +568,81 @@ class IndicatorsTreeView(QtWidgets.QTreeView):
         )
         self._main_widget.commit_if()
 
-    @staticmethod
-    def _get_link(id_):
-        return "http://data.worldbank.org/indicator/{}?view=chart".format(id_)
-
     def _fetch_indicators(self, progress=lambda val: None):
-        """Background task for fetching indicators."""
-        progress(0)
-        def row_item(display_value, item_values=None):
-            """Generate a cell item for a given row."""
-            if not item_values:
-                item_values = {}
-            item = QtGui.QStandardItem()
-            item.setData(display_value, Qt.DisplayRole)
-            for role, value in item_values.items():
-                item.setData(value, role)
-            return item
+        """Background task for fetching indicators.
 
+        The table with the filter index and sort keys is built here as well,
+        so that showing a long list does not block the GUI thread.
+        """
         progress(10)
         filter_ = self._main_widget.basic_indicator_filter()
         data = self._api.get_indicators(filter_=filter_)
-        self._indicator_data = {ind["id"]: ind for ind in data}
-        progress(70)
-
-        indicators = [[""] + row for row in
-                      self._api.get_indicator_list(filter_=filter_)]
-
-        model = QtGui.QStandardItemModel()
-        model.setHorizontalHeaderLabels(indicators[0])
-        for row in indicators[1:]:
-            search_string = " | ".join(row).lower()
-            row_data = [row_item(item) for item in row]
-            row_data[0].setData(search_string, TEXTFILTERROLE)
-            row_data[1].setData(self._get_link(row[1]), gui.LinkRole)
-            model.appendRow(row_data)
-
+        indicator_data = {ind["id"]: ind for ind in data}
+        progress(50)
+        table = IndicatorTable(data)
         progress(100)
-        if QThread.currentThread() is not QCoreApplication.instance().thread():
-            model.moveToThread(QCoreApplication.instance().thread())
-        return model
+        return indicator_data, table
 
     def _init_exception(self):
         pass
 
-    def _fetch_indicators_finished(self):
+    def _refresh_indicators(self):
+        """Start a background refresh of an indicator list from the snapshot.
+
+        The list is refreshed only once per view, so that without network
+        access the snapshot list is kept without repeated attempts.
+        """
+        if self._refresh_task is not None:
+            return
+        self._refresh_task = concurrent.Task(function=partial(
+            self._api.get_indicators, filter_=None, refresh=True))
+        self._refresh_task.resultReady.connect(
+            self._refresh_indicators_finished)
+        self._refresh_task.exceptionReady.connect(
+            self._refresh_indicators_failed)
+        self._executor.submit(self._refresh_task)
+
+    def _refresh_indicators_finished(self, _):
+        """Show the refreshed indicator list and keep the selection."""
+        self.fetch_indicators(selected_ids=self._get_selected_ids())
+
+    @staticmethod
+    def _refresh_indicators_failed(exception):
+        logger.warning("Failed to refresh the indicator list, using the "
+                       "bundled snapshot: %s", exception)
+
+    def _select_ids(self, ids):
+        """Select rows of the given indicator ids."""
+        proxy = self.model()
+        model = proxy.sourceModel()
+        positions = np.empty(len(model.row_order), dtype=int)
+        positions[model.row_order] = np.arange(len(model.row_order))
+        selection = QtCore.QItemSelection()
+        for row in positions[np.isin(model.ids, list(ids))]:
+            index = proxy.mapFromSource(model.index(int(row), 0))
+            if index.isValid():
+                selection.select(index, index)
+        self.selectionModel().select(
+            selection, QtCore.QItemSelectionModel.ClearAndSelect |
+            QtCore.QItemSelectionModel.Rows)
+
+    def _fetch_indicators_finished(self, task):
         """Finish handler for fetching indicators.
 
         This takes the _fetch_indicators result and updates the displayed list
-        of indicators.
+        of indicators. Results of tasks that were replaced by a newer fetch
+        are ignored, so that they can not overwrite a newer list.
         """
         assert self.thread() is QtCore.QThread.currentThread()
-        if self._fetch_task is None:
+        if task is not self._fetch_task:
             return
-        model = self._fetch_task.result()
-        model.setParent(self)
+        self._fetch_task = None
+        try:
+            self._indicator_data, table = task.result()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to load the indicator list.")
+            return
+        model = IndicatorTableModel(table, parent=self)
 
         proxy = self.model()
         proxy.setFilterKeyColumn(0)
@@ -285,8 +650,11 @@ class IndicatorsTreeView(QtWidgets.QTreeView):
         proxy.setFilterCaseSensitivity(False)
         # proxy.setFilterFixedString(self.filterString)
 
+        old_model = proxy.sourceModel()
         proxy.setSourceModel(model)
         proxy.sort(1, QtCore.Qt.DescendingOrder)
+        if old_model is not None:
+            old_model.deleteLater()
 
         # self.progressBarFinished()
 
@@ -302,4 +670,9 @@ class IndicatorsTreeView(QtWidgets.QTreeView):
         self._main_widget.print_info()
 
         self._main_widget.setBlocking(False)
-        self._main_widget.setEnabled(True)
+        self.setEnabled(True)
+
+        if self._restore_ids:
+            self._select_ids(self._restore_ids)
+        if self._api.indicators_from_snapshot:
+            self._refresh_indicators()
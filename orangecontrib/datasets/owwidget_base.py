@@ -4,15 +4,18 @@ This module contains the world bank data widget, used for fetching data from
 world bank data API.
 """
 
+import math
 import logging
 import collections
 from functools import partial
 
-import requests
 from AnyQt import QtCore
 from Orange.widgets import widget
 from Orange.widgets.utils import concurrent
 
+from orangecontrib.datasets import api_wrapper
+from orangecontrib.datasets import transport
+
 
 logger = logging.getLogger(__name__)
 
@@ -30,29 +33,67 @@ class OWWidgetBase(widget.OWWidget):
     category = "Datasets"
     country_selection = None
 
+    TABLE_CACHE_SIZE = 8
+    COMMIT_DELAY = 300  # milliseconds
+
     def __init__(self):
         super().__init__()
         logger.debug("Initializing %s", self.__class__.__name__)
         self._fetch_task = None
         self._info_label = None
         self._selection_changed = False
-        self._set_progress_flag = False
         self._executor = concurrent.ThreadExecutor()
+        self._background_tasks = []
+        self._fetch_query = None
+        self._dataset = None
+        self._dataset_query = None
+        self._table_cache = collections.OrderedDict()
+        self._fetch_generation = 0
+        self._request = None
+        self._commit_timer = QtCore.QTimer(self)
+        self._commit_timer.setSingleShot(True)
+        self._commit_timer.setInterval(self.COMMIT_DELAY)
+        self._commit_timer.timeout.connect(self.commit)
         self.info_data = collections.OrderedDict([
             ("Server status", None),
             ("Indicators", None),
             ("Selected countries", None),
             ("Rows", None),
             ("Columns", None),
+            ("Download", None),
+            ("Cache", None),
             ("Warning", None),
         ])
 
+    def _run_in_background(self, function, callback=None):
+        """Run a function in a background thread.
+
+        Args:
+            function: callable without arguments.
+            callback: function that receives the result in the GUI thread.
+        """
+        task = concurrent.Task(function=function)
+        self._background_tasks.append(task)
+        if callback is not None:
+            task.resultReady.connect(callback)
+        task.exceptionReady.connect(self._background_task_exception)
+        task.finished.connect(lambda: self._background_tasks.remove(task))
+        self._executor.submit(task)
+        return task
+
+    @staticmethod
+    def _background_task_exception(exception):
+        logger.exception(exception)
+
     def _check_server_status(self):
-        try:
-            requests.get('http://api.worldbank.org', timeout=1)
-            self.info_data["Server status"] = "Up"
-        except requests.exceptions.Timeout:
-            self.info_data["Server status"] = "Down"
+        """Check the API server status without blocking the GUI."""
+        self.info_data["Server status"] = "Checking"
+        self.print_info()
+        self._run_in_background(transport.check_status,
+                                self._set_server_status)
+
+    def _set_server_status(self, status):
+        self.info_data["Server status"] = "Up" if status else "Down"
         self.print_info()
 
     def print_info(self):
@@ -67,30 +108,74 @@ class OWWidgetBase(widget.OWWidget):
         """Auto commit handler.
 
         This function must be called on every action that should trigger an
-        auto commit.
+        auto commit. Commits are delayed by COMMIT_DELAY, so that a burst of
+        changes results in a single commit.
         """
         logger.debug("Commit If - auto_commit: %s", self.auto_commit)
         if self.auto_commit:
-            self.commit()
+            self._commit_timer.start()
         else:
             self._selection_changed = True
 
     def commit(self):
-        """Fetch the climate data and send a new orange table."""
+        """Fetch the data and send a new orange table.
+
+        If data for the current query was already fetched, the table is
+        created from the stored dataset, or taken from the table cache,
+        without fetching anything. A fetch that is still running for a
+        different query is cancelled and its result is never sent.
+        """
         logger.debug("commit data")
-        self.setEnabled(False)
-        self._set_progress_flag = True
+        self._commit_timer.stop()
+        query = self._get_query()
+        if self._fetch_task is not None and query == self._fetch_query:
+            logger.debug("Fetch for query %s is already running", query)
+            return
+        self._cancel_fetch()
+
+        table_key = (query, self._get_output_options())
+        if table_key in self._table_cache or (
+                self._dataset is not None and query == self._dataset_query):
+            logger.debug("Using stored data for query %s", query)
+            self._send_table(query)
+            return
+
+        self._fetch_generation += 1
+        self._fetch_query = query
+        update_progress = concurrent.methodinvoke(
+            self, "_update_progress", (int, float, float, float))
+        self._request = api_wrapper.FetchRequest(
+            progress_callback=partial(update_progress, self._fetch_generation))
+        self.progressBarInit()
 
-        func = partial(
-            self._fetch_dataset,
-            concurrent.methodinvoke(self, "set_progress", (float,))
-        )
+        func = partial(self._fetch_dataset, self._request)
         self._fetch_task = concurrent.Task(function=func)
-        self._fetch_task.finished.connect(self._fetch_dataset_finished)
-        self._fetch_task.exceptionReady.connect(self._fetch_dataset_exception)
+        self._fetch_task.finished.connect(
+            partial(self._fetch_dataset_finished, self._fetch_generation))
+        self._fetch_task.exceptionReady.connect(
+            partial(self._fetch_dataset_failed, self._fetch_generation))
         self._executor.submit(self._fetch_task)
 
-    def _fetch_dataset(self, set_progress=None):
+    def _cancel_fetch(self):
+        """Cancel the running fetch, if any."""
+        if self._fetch_task is None:
+            return
+        logger.debug("Cancelling fetch for query %s", self._fetch_query)
+        self._request.cancel()
+        self._fetch_task = None
+        self._fetch_query = None
+        self.info_data["Download"] = None
+        self.progressBarFinished()
+
+    def _fetch_dataset(self, request):
+        """Fetch a dataset for the current query.
+
+        This runs in a worker thread.
+
+        Args:
+            request: api_wrapper.FetchRequest that must be passed to the API
+                for progress reporting and cancellation.
+        """
         raise NotImplementedError(
             "Missing implementation for _fetch_dataset.")
 
@@ -98,22 +183,70 @@ class OWWidgetBase(widget.OWWidget):
         raise NotImplementedError(
             "Missing implementation for _dataset_to_table.")
 
-    def _fetch_dataset_finished(self):
-        """Send data signal on finished dataset fetch."""
-        assert self.thread() is QtCore.QThread.currentThread()
-        self.setEnabled(True)
-        self._set_progress_flag = False
-        self.set_progress(100)
+    def _get_query(self):
+        """Get a hashable description of data that should be fetched."""
+        raise NotImplementedError(
+            "Missing implementation for _get_query.")
 
-        if self._fetch_task is None:
-            return
+    def _get_output_options(self):
+        """Get a hashable description of the output table format.
 
-        dataset = self._fetch_task.result()
-        data_table = self._dataset_to_table(dataset)
+        Options returned here only change how a fetched dataset is converted
+        to a table, so changing them does not require a new fetch.
+        """
+        raise NotImplementedError(
+            "Missing implementation for _get_output_options.")
+
+    def _send_table(self, query):
+        """Send a table for the given query and current output options.
 
+        Tables are created from the last fetched dataset and kept in a small
+        least recently used cache.
+        """
+        key = (query, self._get_output_options())
+        data_table = self._table_cache.get(key)
+        if data_table is None:
+            data_table = self._dataset_to_table(self._dataset)
+            self._table_cache[key] = data_table
+            while len(self._table_cache) > self.TABLE_CACHE_SIZE:
+                self._table_cache.popitem(last=False)
+        else:
+            self._table_cache.move_to_end(key)
+
+        self._update_cache_info()
         self.print_info()
         self.send("Data", data_table)
 
+    def _fetch_dataset_finished(self, generation):
+        """Send data signal on finished dataset fetch.
+
+        Results of fetches that were cancelled or superseded by a newer
+        commit are ignored.
+        """
+        assert self.thread() is QtCore.QThread.currentThread()
+        if generation != self._fetch_generation or self._fetch_task is None:
+            return
+        task, self._fetch_task = self._fetch_task, None
+        self.info_data["Download"] = None
+        self.progressBarFinished()
+        if task.future().exception() is not None:
+            return
+
+        self._dataset = task.result()
+        self._dataset_query, self._fetch_query = self._fetch_query, None
+        self._send_table(self._dataset_query)
+
+    def _update_cache_info(self):
+        """Show data cache hit and miss counts in the info box."""
+        data_cache = getattr(getattr(self, "_api", None), "data_cache", None)
+        if data_cache is not None:
+            self.info_data["Cache"] = "{hits} hits, {misses} misses".format(
+                **data_cache.stats)
+
+    def _fetch_dataset_failed(self, generation, exception):
+        if generation == self._fetch_generation:
+            self._fetch_dataset_exception(exception)
+
     @staticmethod
     def _fetch_dataset_exception(exception):
         logger.exception(exception)
@@ -122,6 +255,9 @@ class OWWidgetBase(widget.OWWidget):
     def set_progress(self, value):
         """set widgets progress indicator.
 
+        A running dataset fetch owns the progress bar, so progress of other
+        work, such as loading the indicator list, is not shown until it ends.
+
         Args:
             value: integer indicating number of percent finished.
         """
@@ -129,10 +265,30 @@ class OWWidgetBase(widget.OWWidget):
         # the progressBarValue is defined in a super class and can not be
         # changed here.
         logger.debug("Set progress: %s", value)
+        if self._fetch_task is not None:
+            return
+        if not self.processingState:
+            self.progressBarInit()
         self.progressBarValue = value
         if value == 100:
             self.progressBarFinished()
 
+    @QtCore.pyqtSlot(int, float, float, float)
+    def _update_progress(self, generation, percent, rate, eta):
+        """Show fetch progress reported by the API wrappers.
+
+        Progress of fetches that were cancelled or superseded is ignored.
+        """
+        if generation != self._fetch_generation or self._fetch_task is None:
+            return
+        download = "{:.1f} pages/s".format(rate)
+        if not math.isnan(eta):
+            download += ", {:.0f} s left".format(eta)
+        self.info_data["Download"] = download
+        self.print_info()
+        # The progress bar is hidden when the fetch finishes.
+        self.progressBarSet(math.floor(percent))
+
     def get_country_codes(self):
         """Get a list of alpha3 codes for selected countries or regions."""
         if self.country_selection:
@@ -141,15 +297,3 @@ class OWWidgetBase(widget.OWWidget):
             return [k for k, v in self.country_selection.items()
                     if v == 2 and len(str(k)) == 3]
         return []
-
-    def _dataset_progress(self, set_progress=None):
-        pass
-
-    def _start_progerss_task(self):
-        func = partial(
-            self._dataset_progress,
-            concurrent.methodinvoke(self, "set_progress", (float,))
-        )
-        progress_task = concurrent.Task(function=func)
-        progress_task.exceptionReady.connect(self._dataset_progress_exception)
-        self._executor.submit(progress_task)
@@ -0,0 +1,158 @@
+"""Bundled snapshot of the country catalog and the indicator list.
+
+Both lists are needed before anything else can be shown in the widgets, and
+downloading them takes a while on first use and is impossible without
+network access. A compressed snapshot of both lists is shipped with the
+package. The country catalog from the snapshot is used when no catalog is
+stored, and the indicator list when the API can not be reached. Widgets
+refresh both from the API in the background.
+
+The snapshot records how and when it was generated in its "metadata" and
+"created" fields. It is regenerated from the live API with:
+
+    python -m orangecontrib.datasets.snapshot
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "data",
+                             "snapshot.json.gz")
+
+# Indicator fields used by the indicator list and descriptions.
+INDICATOR_FIELDS = ["id", "name", "source", "sourceNote",
+                    "sourceOrganization", "topics"]
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def _is_valid(data):
+    """Check that all countries and indicators have the fields we use.
+
+    Aggregates without an iso2Code would be dropped from every dataset,
+    because data points are matched to countries by their iso2 codes.
+    """
+    countries = data.get("countries")
+    indicators = data.get("indicators")
+    if not isinstance(countries, list) or not isinstance(indicators, list):
+        return False
+    return (
+        all(country.get("id") and country.get("iso2Code") and
+            country.get("name") for country in countries) and
+        all(indicator.get("id") and indicator.get("name")
+            for indicator in indicators)
+    )
+
+
+def load(path=None):
+    """Load a snapshot file.
+
+    Args:
+        path: Path to the snapshot. Defaults to the bundled snapshot.
+
+    Returns:
+        dict with "version", "created", "metadata", "countries" and
+        "indicators" keys, or None if there is no valid snapshot of the
+        current version.
+    """
+    path = path or SNAPSHOT_PATH
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as snapshot_file:
+            data = json.load(snapshot_file)
+    except (OSError, ValueError):
+        logger.debug("No valid snapshot in %s", path)
+        return None
+    if data.get("version") != SNAPSHOT_VERSION:
+        logger.info("Ignoring snapshot version %s", data.get("version"))
+        return None
+    if not _is_valid(data):
+        logger.warning("Ignoring invalid snapshot in %s", path)
+        return None
+    return data
+
+
+def get_snapshot():
+    """Get the bundled snapshot, loaded only once per process."""
+    # pylint: disable=global-statement
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = load() or {}
+        return _snapshot or None
+
+
+def get_countries():
+    """Get a copy of the snapshot country list or None."""
+    snapshot = get_snapshot()
+    if not snapshot or not snapshot.get("countries"):
+        return None
+    return json.loads(json.dumps(snapshot["countries"]))
+
+
+def get_indicators():
+    """Get the snapshot indicator list or None."""
+    snapshot = get_snapshot()
+    if not snapshot or not snapshot.get("indicators"):
+        return None
+    return list(snapshot["indicators"])
+
+
+def save(countries, indicators, path=None, metadata=None):
+    """Write a snapshot file.
+
+    Args:
+        countries: list of country dicts as returned by the indicator API.
+        indicators: list of indicator dicts as returned by the indicator API.
+        path: Output path. Defaults to the bundled snapshot path.
+        metadata: dict describing how the snapshot was generated.
+    """
+    path = path or SNAPSHOT_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "created": time.time(),
+        "metadata": metadata or {},
+        "countries": countries,
+        "indicators": [
+            {key: indicator[key] for key in INDICATOR_FIELDS
+             if key in indicator}
+            for indicator in indicators
+        ],
+    }
+    with gzip.open(path, "wt", encoding="utf-8") as snapshot_file:
+        json.dump(data, snapshot_file, separators=(",", ":"),
+                  sort_keys=True)
+    logger.info("Saved snapshot with %d countries and %d indicators to %s",
+                len(countries), len(indicators), path)
+
+
+def main(argv=None):  # pragma: no cover
+    """Regenerate the snapshot from the live API."""
+    # Imported here, because the API modules use this module.
+    from orangecontrib.datasets import api_wrapper
+    from orangecontrib.datasets import countries
+
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else None
+    api = api_wrapper.IndicatorAPI()
+    indicators = api.get_indicators(filter_=None, refresh=True)
+    metadata = {
+        "source": api.BASE_URL,
+        "generator": "python -m orangecontrib.datasets.snapshot",
+    }
+    # pylint: disable=protected-access
+    save(countries._get_countries(), indicators, path, metadata)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Tests for non widget modules."""
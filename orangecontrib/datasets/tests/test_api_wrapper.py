@@ -0,0 +1,712 @@
+"""Tests for extended indicator and climate datasets."""
+
+# pylint: disable=protected-access
+
+import collections
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import numpy as np
+
+from orangecontrib.datasets import api_wrapper
+from orangecontrib.datasets import cache
+from orangecontrib.datasets import countries
+
+
+COUNTRIES = [
+    {
+        "id": "SVN",
+        "iso2Code": "SI",
+        "name": "Slovenia",
+        "region": {"id": "ECS", "value": "Europe & Central Asia"},
+        "adminregion": {"id": "", "value": ""},
+        "incomeLevel": {"id": "HIC", "value": "High income"},
+        "lendingType": {"id": "LNX", "value": "Not classified"},
+        "longitude": "14.5044",
+        "latitude": "46.0546",
+    },
+    {
+        "id": "AUT",
+        "iso2Code": "AT",
+        "name": "Austria",
+        "region": {"id": "ECS", "value": "Europe & Central Asia"},
+        "adminregion": {"id": "", "value": ""},
+        "incomeLevel": {"id": "HIC", "value": "High income"},
+        "lendingType": {"id": "LNX", "value": "Not classified"},
+        "longitude": "16.3798",
+        "latitude": "48.2201",
+    },
+    {
+        "id": "WLD",
+        "iso2Code": "1W",
+        "name": "World",
+        "region": {"id": "NA", "value": "Aggregates"},
+        "adminregion": {"id": "", "value": ""},
+        "incomeLevel": {"id": "NA", "value": "Aggregates"},
+        "lendingType": {"id": "", "value": "Aggregates"},
+        "longitude": "",
+        "latitude": "",
+    },
+]
+
+
+def _datapoint(iso2, name, date, value):
+    return {
+        "country": {"id": iso2, "value": name},
+        "date": date,
+        "value": value,
+    }
+
+
+RESPONSES = {
+    "sp.pop.totl": [
+        _datapoint("SI", "Slovenia", "2001", "2000000"),
+        _datapoint("SI", "Slovenia", "2000", "1990000"),
+        _datapoint("AT", "Austria", "2001", "8000000"),
+        _datapoint("AT", "Austria", "2000", None),
+        _datapoint("1W", "World", "2001", "6000000000"),
+        _datapoint("1W", "World", "1999", None),
+    ],
+    "ny.gdp.mktp.cd": [
+        _datapoint("SI", "Slovenia", "2001", "2.1e10"),
+        _datapoint("AT", "Austria", "2001", "3e11"),
+    ],
+}
+
+
+def _patch_catalog(test_case):
+    """Use the fixture country catalog instead of the stored one."""
+    catalog = countries.CountryCatalog(COUNTRIES, timestamp=time.time())
+    patcher = mock.patch.object(countries, "get_catalog",
+                                return_value=catalog)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+class TestParsePeriods(unittest.TestCase):
+    """Tests for bulk wbd period parsing."""
+
+    def test_parse_periods(self):
+        seconds = api_wrapper.parse_periods(
+            ["2005", "2002Q3", "1999M7", "Last Known Value", "2005", 1901])
+        np.testing.assert_array_equal(seconds, [
+            1104537600,  # 2005-01-01
+            1025481600,  # 2002-07-01
+            930787200,  # 1999-07-01
+            np.nan,
+            1104537600,
+            -2177452800,  # 1901-01-01
+        ])
+
+    def test_parse_empty(self):
+        self.assertEqual(api_wrapper.parse_periods([]).shape, (0,))
+
+
+class TestIndicatorDataset(unittest.TestCase):
+    """Tests for columnar indicator data representation."""
+
+    def test_as_columns_single_indicator(self):
+        dataset = api_wrapper.IndicatorDataset(
+            {"sp.pop.totl": RESPONSES["sp.pop.totl"]}, COUNTRIES)
+        values, labels, headers = dataset.as_columns()
+
+        self.assertEqual(values.dtype, np.float64)
+        self.assertEqual(list(labels), ["Austria", "Slovenia", "World"])
+        # 1999 only contains empty values and is removed.
+        self.assertEqual(headers, ["2000", "2001"])
+        np.testing.assert_array_equal(values, [
+            [np.nan, 8e6],
+            [1.99e6, 2e6],
+            [np.nan, 6e9],
+        ])
+
+    def test_as_columns_time_series(self):
+        dataset = api_wrapper.IndicatorDataset(RESPONSES, COUNTRIES)
+        values, labels, headers = dataset.as_columns(time_series=True)
+
+        self.assertEqual(list(labels), ["1999", "2000", "2001"])
+        self.assertEqual(headers, [
+            "ny.gdp.mktp.cd - Austria",
+            "ny.gdp.mktp.cd - Slovenia",
+            "sp.pop.totl - Austria",
+            "sp.pop.totl - Slovenia",
+            "sp.pop.totl - World",
+        ])
+        np.testing.assert_array_equal(values[2], [3e11, 2.1e10, 8e6, 2e6, 6e9])
+        self.assertTrue(np.isnan(values[0]).all())
+
+    def test_as_columns_empty(self):
+        dataset = api_wrapper.IndicatorDataset({}, COUNTRIES)
+        values, labels, headers = dataset.as_columns()
+        self.assertEqual(values.size, 0)
+        self.assertEqual(len(labels), 0)
+        self.assertEqual(headers, [])
+        self.assertIsNone(dataset.as_orange_table())
+
+    def test_country_table(self):
+        dataset = api_wrapper.IndicatorDataset(RESPONSES, COUNTRIES)
+        table = dataset.as_orange_table()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(len(table.domain.attributes), 3)
+        self.assertEqual(table.metas[1, 0], "Slovenia")
+
+
+class TestCountryMetadata(unittest.TestCase):
+    """Tests for encoded country metadata."""
+
+    def test_meta_columns(self):
+        metadata = api_wrapper.CountryMetadata(COUNTRIES)
+        region = metadata.variables[1]
+        self.assertEqual(list(region.values),
+                         ["Aggregates", "Europe & Central Asia"])
+
+        meta = metadata.meta_columns(["World", "Slovenia", "Unknown"])
+        self.assertEqual(list(meta[:, 0]), ["World", "Slovenia", "Unknown"])
+        self.assertEqual(meta[0, 1], 0)
+        self.assertEqual(meta[1, 1], 1)
+        # admin region is empty for all countries
+        self.assertTrue(np.isnan(meta[1, 2]))
+        self.assertAlmostEqual(meta[1, 4], 14.5044)
+        self.assertTrue(np.isnan(meta[0, 4]))
+        self.assertTrue(all(np.isnan(v) for v in meta[2, 1:]))
+
+    def test_from_countries_cache(self):
+        countries_ = list(COUNTRIES)
+        first = api_wrapper.CountryMetadata.from_countries(countries_)
+        self.assertIs(api_wrapper.CountryMetadata.from_countries(countries_),
+                      first)
+        # the cache is keyed by list identity, not by its contents
+        self.assertIsNot(
+            api_wrapper.CountryMetadata.from_countries(list(COUNTRIES)), first)
+
+    def test_dataset_uses_catalog_list(self):
+        catalog = countries.CountryCatalog(list(COUNTRIES))
+        first = api_wrapper.IndicatorDataset(RESPONSES, catalog.countries)
+        second = api_wrapper.IndicatorDataset(RESPONSES, catalog.countries)
+        first_metas = first.as_orange_table().domain.metas
+        second_metas = second.as_orange_table().domain.metas
+        self.assertTrue(all(a is b for a, b in zip(first_metas, second_metas)))
+
+
+def _fake_fetch(url, *_, **__):
+    """Return paged responses with two data points per page."""
+    if "/indicators/" not in url:
+        return json.dumps([{"page": 1, "pages": 1}, COUNTRIES])
+    indicator = re.search(r"indicators/([^?/]+)", url).group(1)
+    page = re.search(r"&page=(\d+)", url)
+    page = int(page.group(1)) if page else 1
+    data = RESPONSES.get(indicator, [])
+    header = {"page": page, "pages": (len(data) + 1) // 2}
+    return json.dumps([header, data[(page - 1) * 2:page * 2]])
+
+
+class TestIndicatorAPI(unittest.TestCase):
+    """Tests for concurrent indicator fetching."""
+
+    def setUp(self):
+        _patch_catalog(self)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_get_dataset(self, fetch):
+        api = api_wrapper.IndicatorAPI(max_workers=4)
+        request = api_wrapper.FetchRequest()
+        dataset = api.get_dataset(["SP.POP.TOTL", "NY.GDP.MKTP.CD"],
+                                  countries=["SVN", "AUT", "WLD"],
+                                  request=request)
+
+        self.assertEqual(list(dataset.api_responses),
+                         ["sp.pop.totl", "ny.gdp.mktp.cd"])
+        population = dataset.api_responses["sp.pop.totl"]
+        self.assertEqual(list(population.dates),
+                         [d["date"] for d in RESPONSES["sp.pop.totl"]])
+        page_urls = [c[0][0] for c in fetch.call_args_list
+                     if "sp.pop.totl" in c[0][0]]
+        self.assertEqual(len(page_urls), 3)
+        self.assertEqual(request.progress, 100)
+        self.assertEqual(request.observer.pages_done, 4)
+        self.assertGreater(request.elapsed, 0)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_concurrent_requests(self, _):
+        api = api_wrapper.IndicatorAPI(max_workers=2)
+        indicators = [["SP.POP.TOTL"], ["NY.GDP.MKTP.CD"], ["SP.POP.TOTL"]]
+        requests = [api_wrapper.FetchRequest() for _ in indicators]
+        with futures.ThreadPoolExecutor(3) as executor:
+            datasets = list(executor.map(
+                lambda args: api.get_dataset(args[0], ["SVN"], request=args[1]),
+                zip(indicators, requests)))
+        for ids, dataset, request in zip(indicators, datasets, requests):
+            self.assertEqual(list(dataset.api_responses), [ids[0].lower()])
+            self.assertEqual(request.progress, 100)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_cancelled_request(self, fetch):
+        api = api_wrapper.IndicatorAPI()
+        request = api_wrapper.FetchRequest()
+        request.cancel()
+        with self.assertRaises(api_wrapper.FetchCancelled):
+            api.get_dataset(["SP.POP.TOTL"], request=request)
+        self.assertFalse(any("/indicators/" in c[0][0]
+                             for c in fetch.call_args_list))
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_get_dataset_delta(self, fetch):
+        iso2_codes = {c["id"]: c["iso2Code"] for c in COUNTRIES}
+
+        def fetch_countries(url, *_, **__):
+            """Return only data points for countries in the url."""
+            codes = re.search(r"countries/([^/]+)/", url).group(1)
+            iso2 = {iso2_codes[code] for code in codes.upper().split(";")}
+            indicator = re.search(r"indicators/([^?/]+)", url).group(1)
+            data = [d for d in RESPONSES.get(indicator, [])
+                    if d["country"]["id"] in iso2]
+            return json.dumps([{"page": 1, "pages": 1}, data])
+
+        def fetched_urls():
+            urls = [c[0][0] for c in fetch.call_args_list]
+            fetch.reset_mock()
+            return urls
+
+        fetch.side_effect = fetch_countries
+        api = api_wrapper.IndicatorAPI()
+        api.get_dataset("SP.POP.TOTL", countries=["SVN"])
+        self.assertEqual(len(fetched_urls()), 1)
+
+        dataset = api.get_dataset(["SP.POP.TOTL", "NY.GDP.MKTP.CD"],
+                                  countries=["SVN", "AUT"])
+        urls = fetched_urls()
+        self.assertEqual(len(urls), 2)
+        self.assertTrue(any("countries/AUT/indicators/sp.pop.totl" in url
+                            for url in urls))
+        self.assertTrue(any("AUT;SVN/indicators/ny.gdp.mktp.cd" in url
+                            for url in urls))
+        self.assertEqual(
+            sorted(dataset.api_responses["sp.pop.totl"].country_ids),
+            ["AT", "AT", "SI", "SI"])
+
+        dataset = api.get_dataset(["NY.GDP.MKTP.CD"], countries=["AUT"])
+        self.assertEqual(fetched_urls(), [])
+        self.assertEqual(list(dataset.api_responses),
+                         ["ny.gdp.mktp.cd"])
+        self.assertEqual(
+            list(dataset.api_responses["ny.gdp.mktp.cd"].country_ids),
+            ["AT"])
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_get_dataset_period(self, fetch):
+        api = api_wrapper.IndicatorAPI()
+        api.get_dataset("SP.POP.TOTL", ["SVN"], date=(2005, 2000))
+        urls = [c[0][0] for c in fetch.call_args_list
+                if "/indicators/" in c[0][0]]
+        self.assertTrue(urls)
+        self.assertTrue(all("&date=2000:2005" in url for url in urls))
+
+        fetch.reset_mock()
+        api.get_dataset("SP.POP.TOTL", ["SVN"], date=(2000, 2005))
+        self.assertEqual(fetch.call_count, 0)
+
+        api.get_dataset("SP.POP.TOTL", ["SVN"], mrv=5)
+        urls = [c[0][0] for c in fetch.call_args_list]
+        self.assertTrue(urls)
+        self.assertTrue(all("&mrv=5" in url and "&date=" not in url
+                            for url in urls))
+
+    def test_period_estimate(self):
+        self.assertEqual(api_wrapper.IndicatorAPI._get_period(),
+                         ("", api_wrapper.POINTS_PER_COUNTRY))
+        self.assertEqual(
+            api_wrapper.IndicatorAPI._get_period((2007, 2016), 5),
+            ("&date=2007:2016&mrv=5", 5))
+
+
+class TestIndicatorList(unittest.TestCase):
+    """Tests for loading the shared indicator list."""
+
+    def setUp(self):
+        for name, value in [("_indicator_list", None),
+                            ("_indicator_sources", None),
+                            ("_indicators_from_snapshot", False)]:
+            patcher = mock.patch.object(api_wrapper.IndicatorAPI, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.api = api_wrapper.IndicatorAPI()
+
+    @mock.patch("orangecontrib.datasets.transport.get_cached",
+                return_value=None)
+    @mock.patch("orangecontrib.datasets.transport.fetch",
+                return_value=json.dumps([{}, [{"id": "NEW.INDICATOR"}]]))
+    def test_fetch_before_snapshot(self, fetch, _):
+        with mock.patch.object(api_wrapper.snapshot, "get_indicators",
+                               return_value=[{"id": "SP.POP.TOTL"}]):
+            indicators = self.api.get_indicators(filter_=None)
+        self.assertEqual(indicators, [{"id": "NEW.INDICATOR"}])
+        self.assertFalse(self.api.indicators_from_snapshot)
+        fetch.assert_called_once()
+
+    @mock.patch("orangecontrib.datasets.transport.get_cached",
+                return_value=None)
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_snapshot_and_refresh(self, fetch, _):
+        fetch.side_effect = OSError
+        with mock.patch.object(api_wrapper.snapshot, "get_indicators",
+                               return_value=[{"id": "SP.POP.TOTL"}]):
+            indicators = self.api.get_indicators(filter_=None)
+            self.assertEqual(indicators, [{"id": "SP.POP.TOTL"}])
+            self.assertTrue(self.api.indicators_from_snapshot)
+
+            # a failed refresh keeps the current list
+            with self.assertRaises(OSError):
+                self.api.get_indicators(filter_=None, refresh=True)
+            self.assertTrue(self.api.indicators_from_snapshot)
+
+        fetch.side_effect = None
+        fetch.return_value = json.dumps([{}, [{"id": "NEW.INDICATOR"}]])
+        indicators = self.api.get_indicators(filter_=None, refresh=True)
+        self.assertEqual(indicators, [{"id": "NEW.INDICATOR"}])
+        self.assertFalse(self.api.indicators_from_snapshot)
+        self.assertEqual(api_wrapper.IndicatorAPI().get_indicators(None),
+                         indicators)
+
+    @mock.patch("orangecontrib.datasets.transport.get_cached",
+                return_value=None)
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=OSError)
+    def test_no_snapshot(self, *_):
+        with mock.patch.object(api_wrapper.snapshot, "get_indicators",
+                               return_value=None):
+            with self.assertRaises(OSError):
+                self.api.get_indicators(filter_=None)
+
+    @mock.patch("orangecontrib.datasets.transport.get_cached",
+                return_value=json.dumps([{}, [{"id": "CACHED"}]]))
+    def test_cached_list(self, _):
+        self.assertEqual(self.api.get_indicators(filter_=None),
+                         [{"id": "CACHED"}])
+        self.assertFalse(self.api.indicators_from_snapshot)
+
+
+class TestIndicatorBatches(unittest.TestCase):
+    """Tests for combined requests of indicators from the same source."""
+
+    INDICATORS = [
+        {"id": "SP.POP.TOTL", "source": {"id": "2"}},
+        {"id": "NY.GDP.MKTP.CD", "source": {"id": "2"}},
+        {"id": "IC.BUS.EASE.XQ", "source": {"id": "1"}},
+    ]
+
+    def setUp(self):
+        for name, value in [("_indicator_list", self.INDICATORS),
+                            ("_indicator_sources", None)]:
+            patcher = mock.patch.object(api_wrapper.IndicatorAPI, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        _patch_catalog(self)
+        self.api = api_wrapper.IndicatorAPI()
+
+    def test_batch_indicators(self):
+        batches = self.api._batch_indicators(
+            ["sp.pop.totl", "ic.bus.ease.xq", "unknown", "ny.gdp.mktp.cd"])
+        self.assertEqual(batches, [("sp.pop.totl", "ny.gdp.mktp.cd"),
+                                   ("ic.bus.ease.xq",), ("unknown",)])
+        with mock.patch.object(api_wrapper, "MAX_BATCH_INDICATORS", 1):
+            self.assertEqual(
+                len(self.api._batch_indicators(
+                    ["sp.pop.totl", "ny.gdp.mktp.cd"])), 2)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_combined_request(self, fetch):
+        def fetch_combined(url, *_, **__):
+            self.assertIn("/v2/country/SVN/indicator/", url)
+            self.assertIn("source=2", url)
+            data = [dict(datapoint, indicator={"id": indicator.upper()})
+                    for indicator in ["sp.pop.totl", "ny.gdp.mktp.cd"]
+                    for datapoint in RESPONSES[indicator]
+                    if datapoint["country"]["id"] == "SI"]
+            return json.dumps([{"page": 1, "pages": 1}, data])
+
+        fetch.side_effect = fetch_combined
+        request = api_wrapper.FetchRequest()
+        dataset = self.api.get_dataset(["SP.POP.TOTL", "NY.GDP.MKTP.CD"],
+                                       countries=["SVN"], request=request)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(request.progress, 100)
+        self.assertEqual(
+            list(dataset.api_responses["sp.pop.totl"].dates), ["2001", "2000"])
+        self.assertEqual(
+            list(dataset.api_responses["ny.gdp.mktp.cd"].values), [2.1e10])
+
+
+class TestClimateDataset(unittest.TestCase):
+    """Tests for climate data tables."""
+
+    RESPONSES = {
+        "SVN": {"tas": {"year": {"response": [{"year": 2000, "data": 1.5},
+                                              {"year": 2001, "data": 2}]}}},
+        "AUT": {"tas": {"year": {"response": [{"year": 2000, "data": 3}]}}},
+    }
+
+    def test_country_table(self):
+        table = api_wrapper.ClimateDataset(self.RESPONSES).as_orange_table()
+        self.assertEqual(table.metas[:, 0].tolist(), ["Austria", "Slovenia"])
+        np.testing.assert_array_equal(table.X[:, 0], [3, 1.5])
+
+    def test_time_series_table(self):
+        table = api_wrapper.ClimateDataset(self.RESPONSES).as_orange_table(
+            time_series=True, use_names=True)
+        self.assertEqual([str(var.name) for var in table.domain.attributes],
+                         ["Austria - tas", "Slovenia - tas"])
+        np.testing.assert_array_equal(table.metas[:, 0],
+                                      [946684800, 978307200])
+
+
+class TestClimateAPI(unittest.TestCase):
+    """Tests for concurrent climate queries."""
+
+    # Year and decade responses in the format of the climate API, for the
+    # 1901 - 1915 part of a CRU temperature series. The API could not be
+    # reached to record them, so the decade response is written from the
+    # server's decade definition: decades start with years divisible by ten
+    # and cover only the years that have data, so the first decade averages
+    # 1901 - 1909 and the last one 1910 - 1915.
+    YEAR_RESPONSE = [
+        {"year": year, "data": data} for year, data in zip(
+            range(1901, 1916),
+            [8.72, 9.15, 8.41, 9.03, 8.86, 9.27, 8.18, 8.64, 8.51,
+             8.93, 9.34, 9.02, 8.77, 9.41, 9.12])
+    ]
+    DECADE_RESPONSE = [
+        {"year": 1900, "data": 8.752222222222223},
+        {"year": 1910, "data": 9.098333333333333},
+    ]
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            api_wrapper.ClimateAPI, "_get_location",
+            side_effect=lambda location: ("country", location))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(api_wrapper, "RETRY_DELAY", 0)
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_get_instrumental(self, fetch):
+        attempts = collections.Counter()
+
+        def fetch_climate(url, *_, **__):
+            attempts[url] += 1
+            if "/AUT" in url and "/pr/" in url:
+                raise ValueError("server error")
+            if "/SVN" in url and attempts[url] == 1:
+                raise ValueError("temporary error")
+            time.sleep(0.01 * (hash(url) % 3))
+            return json.dumps([{"year": 2000, "data": len(url)}])
+
+        fetch.side_effect = fetch_climate
+        api = api_wrapper.ClimateAPI(max_workers=4)
+        request = api_wrapper.FetchRequest()
+        dataset = api.get_instrumental(["SVN", "AUT"], ["tas", "pr"],
+                                       ["year"], request=request)
+
+        responses = dataset.api_responses
+        self.assertEqual(list(responses), ["SVN", "AUT"])
+        self.assertEqual(list(responses["SVN"]), ["tas", "pr"])
+        self.assertEqual(list(responses["AUT"]), ["tas"])
+        self.assertEqual(request.progress, 100)
+        self.assertEqual(request.observer.pages_done, 3)
+        # failed SVN queries succeed on the second attempt, failing AUT
+        # query is tried once and then retried CLIMATE_RETRIES times
+        self.assertEqual(sorted(attempts.values()),
+                         [1, 2, 2, api_wrapper.CLIMATE_RETRIES + 1])
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_cached_queries(self, fetch):
+        fetch.side_effect = lambda url, *_, **__: json.dumps(
+            [{"year": 2000, "data": url[-3:]}])
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        api = api_wrapper.ClimateAPI(data_cache=cache.DatasetCache(
+            os.path.join(temp_dir, "climate.sqlite")))
+
+        api.get_instrumental(["SVN"], ["tas"], ["year", "decade"])
+        self.assertEqual(fetch.call_count, 2)
+
+        fetch.reset_mock()
+        request = api_wrapper.FetchRequest()
+        dataset = api.get_instrumental(["SVN", "AUT"], ["tas"], ["year"],
+                                       request=request)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertIn("/AUT", fetch.call_args[0][0])
+        self.assertEqual(request.progress, 100)
+        self.assertEqual(
+            dataset.api_responses["SVN"]["tas"]["year"]["response"],
+            [{"year": 2000, "data": "SVN"}])
+
+    def test_decade_averages(self):
+        response = [{"year": year, "data": float(year % 100)}
+                    for year in range(1901, 1921)]
+        response.append({"year": 1921, "data": None})
+        self.assertEqual(api_wrapper.ClimateAPI._decade_averages(response), [
+            {"year": 1900, "data": 5.0},  # 1901 - 1909
+            {"year": 1910, "data": 14.5},
+            {"year": 1920, "data": 20.0},
+        ])
+        self.assertEqual(api_wrapper.ClimateAPI._decade_averages([]), [])
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_derive_decades(self, fetch):
+        fetch.side_effect = lambda url, *_, **__: json.dumps(
+            [{"year": 1990, "data": 1}, {"year": 1999, "data": 2},
+             {"year": 2000, "data": 4}] if "/year/" in url else
+            [{"month": month, "data": month} for month in range(12)])
+        api = api_wrapper.ClimateAPI()
+        dataset = api.get_instrumental(["SVN"], ["tas"], ["decade", "month"],
+                                       derive_decades=True)
+        urls = sorted(c[0][0].split("/")[-2] for c in fetch.call_args_list)
+        self.assertEqual(urls, ["month", "year"])
+        responses = dataset.api_responses["SVN"]["tas"]
+        self.assertEqual(sorted(responses), ["decade", "month"])
+        self.assertEqual(responses["decade"]["response"],
+                         [{"year": 1990, "data": 1.5},
+                          {"year": 2000, "data": 4.0}])
+
+        fetch.reset_mock()
+        dataset = api.get_instrumental(["SVN"], ["tas"], ["decade", "year"],
+                                       derive_decades=True)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(sorted(dataset.api_responses["SVN"]["tas"]),
+                         ["decade", "year"])
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_derived_decade_response(self, fetch):
+        fetch.side_effect = lambda url, *_, **__: json.dumps(
+            self.YEAR_RESPONSE if "/year/" in url else self.DECADE_RESPONSE)
+        api = api_wrapper.ClimateAPI()
+        fetched = api.get_instrumental(["SVN"], ["tas"], ["decade"])
+        derived = api.get_instrumental(["SVN"], ["tas"], ["decade"],
+                                       derive_decades=True)
+
+        fetched_decades = fetched.api_responses["SVN"]["tas"]["decade"]
+        derived_decades = derived.api_responses["SVN"]["tas"]["decade"]
+        self.assertEqual(
+            [item["year"] for item in derived_decades["response"]],
+            [item["year"] for item in fetched_decades["response"]])
+        np.testing.assert_allclose(
+            [item["data"] for item in derived_decades["response"]],
+            [item["data"] for item in fetched_decades["response"]])
+
+        fetched_table = fetched.as_orange_table()
+        derived_table = derived.as_orange_table()
+        self.assertEqual(derived_table.domain, fetched_table.domain)
+        np.testing.assert_allclose(derived_table.X, fetched_table.X)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_cancelled(self, fetch):
+        request = api_wrapper.FetchRequest()
+        request.cancel()
+        with self.assertRaises(api_wrapper.FetchCancelled):
+            api_wrapper.ClimateAPI().get_instrumental(["SVN"],
+                                                      request=request)
+        fetch.assert_not_called()
+
+
+class TestProgressObserver(unittest.TestCase):
+    """Tests for progress reporting."""
+
+    def test_progress(self):
+        reports = []
+        observer = api_wrapper.ProgressObserver(
+            lambda *args: reports.append(args), max_rate=float("inf"))
+        observer.add_units(2)
+        observer.page_done("a", 4)
+        self.assertAlmostEqual(observer.percent, 12.5)
+        observer.unit_done("a")
+        observer.page_done("b", 2)
+        self.assertAlmostEqual(observer.percent, 75)
+        observer.unit_done("b")
+        self.assertTrue(observer.finished)
+        self.assertEqual(reports[-1][0], 100)
+        self.assertEqual(observer.pages_done, 2)
+
+    def test_rate_limit(self):
+        reports = []
+        observer = api_wrapper.ProgressObserver(
+            lambda *args: reports.append(args), max_rate=1e-3)
+        observer.add_units(3)
+        for unit in range(3):
+            observer.page_done(unit, 1)
+            observer.unit_done(unit)
+        # first report, then only the final one
+        self.assertEqual([r[0] for r in reports], [0, 100])
+
+
+class TestQueryPlan(unittest.TestCase):
+    """Tests for choosing between all countries and country lists."""
+
+    def setUp(self):
+        _patch_catalog(self)
+        self.api = api_wrapper.IndicatorAPI()
+
+    def test_plan(self):
+        plan = self.api._plan_query(frozenset(["SVN"]), [1, 1])
+        self.assertEqual(plan.batches, ["SVN"])
+        self.assertEqual(plan.pages, 2)
+
+        plan = self.api._plan_query(frozenset(["SVN", "AUT", "WLD"]))
+        self.assertEqual(plan.batches, ["all"])
+        self.assertEqual(self.api._plan_query(None).batches, ["all"])
+
+    @mock.patch.object(api_wrapper, "MAX_URL_LENGTH", 0)
+    def test_batches(self):
+        plan = self.api._plan_query(frozenset(["SVN", "AUT"]))
+        self.assertEqual(plan.batches, ["all"])
+        with mock.patch.object(api_wrapper, "REQUEST_COST", 0):
+            plan = self.api._plan_query(frozenset(["SVN", "AUT"]))
+        self.assertEqual(plan.batches, ["AUT", "SVN"])
+
+    @mock.patch.object(api_wrapper, "MAX_URL_LENGTH", 0)
+    @mock.patch.object(api_wrapper, "REQUEST_COST", 0)
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_concurrent_batches(self, fetch):
+        # First pages of both country batches must be requested before either
+        # of them returns.
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fetch_batch(url, *_, **__):
+            if "/indicators/" in url and "&page=" not in url:
+                barrier.wait()
+            return _fake_fetch(url)
+
+        fetch.side_effect = fetch_batch
+        request = api_wrapper.FetchRequest()
+        dataset = self.api.get_dataset("SP.POP.TOTL", ["SVN", "AUT"],
+                                       request=request)
+        urls = [c[0][0] for c in fetch.call_args_list
+                if "/indicators/" in c[0][0]]
+        self.assertEqual({re.search(r"countries/(\w+)/", url).group(1)
+                          for url in urls}, {"AUT", "SVN"})
+        self.assertFalse(barrier.broken)
+        self.assertEqual(request.progress, 100)
+        self.assertTrue(len(dataset.api_responses["sp.pop.totl"]))
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_select_countries(self, _):
+        dataset = self.api.get_dataset("SP.POP.TOTL", ["SVN", "WLD"])
+        series = dataset.api_responses["sp.pop.totl"]
+        self.assertEqual(sorted(set(series.country_ids)), ["1W", "SI"])
+
+    @mock.patch("orangecontrib.datasets.transport.fetch", side_effect=_fake_fetch)
+    def test_select_countries_snapshot(self, _):
+        catalog = countries.CountryCatalog.from_snapshot()
+        with mock.patch.object(countries, "get_catalog",
+                               return_value=catalog):
+            dataset = self.api.get_dataset("SP.POP.TOTL",
+                                           catalog.aggregate_ids +
+                                           catalog.country_ids)
+        series = dataset.api_responses["sp.pop.totl"]
+        self.assertEqual(sorted(set(series.country_ids)), ["1W", "AT", "SI"])
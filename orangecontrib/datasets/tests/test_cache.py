@@ -0,0 +1,68 @@
+"""Tests for the persistent dataset cache."""
+
+# pylint: disable=protected-access
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from orangecontrib.datasets import cache
+
+
+class TestDatasetCache(unittest.TestCase):
+    """Tests for storing, expiring and evicting cache entries."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_put(self):
+        data_cache = cache.DatasetCache(self.path)
+        key = cache.make_key("indicator", "sp.pop.totl", ["SVN"])
+        self.assertIsNone(data_cache.get(key))
+
+        data_cache.put(key, {"values": np.arange(3.0),
+                             "dates": np.array(["2000", "2001", "2002"])})
+        arrays = cache.DatasetCache(self.path).get(key)
+        np.testing.assert_array_equal(arrays["values"], [0, 1, 2])
+        self.assertEqual(arrays["dates"].tolist(), ["2000", "2001", "2002"])
+        self.assertEqual(data_cache.stats, {"hits": 0, "misses": 1})
+
+    def test_make_key(self):
+        self.assertEqual(cache.make_key("a", {"x": 1, "y": 2}),
+                         cache.make_key("a", {"y": 2, "x": 1}))
+        self.assertNotEqual(cache.make_key("a", ["SVN"]),
+                            cache.make_key("a", ["AUT"]))
+
+    def test_ttl(self):
+        data_cache = cache.DatasetCache(self.path, ttl=10)
+        with mock.patch("time.time", return_value=1000):
+            data_cache.put("key", {"values": np.zeros(1)})
+        with mock.patch("time.time", return_value=1005):
+            self.assertIsNotNone(data_cache.get("key"))
+        with mock.patch("time.time", return_value=1011):
+            self.assertIsNone(data_cache.get("key"))
+
+    def test_lru_eviction(self):
+        data_cache = cache.DatasetCache(self.path, ttl=float("inf"))
+        size = len(data_cache._dumps({"values": np.random.random(100)}))
+        data_cache.max_size = size * 2.5
+        with mock.patch("time.time", return_value=1000):
+            data_cache.put("a", {"values": np.random.random(100)})
+        with mock.patch("time.time", return_value=1001):
+            data_cache.put("b", {"values": np.random.random(100)})
+        with mock.patch("time.time", return_value=1002):
+            data_cache.get("a")
+        with mock.patch("time.time", return_value=1003):
+            data_cache.put("c", {"values": np.random.random(100)})
+
+        self.assertIsNotNone(data_cache.get("a"))
+        self.assertIsNone(data_cache.get("b"))
+        self.assertIsNotNone(data_cache.get("c"))
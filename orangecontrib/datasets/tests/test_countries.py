@@ -0,0 +1,162 @@
+"""Tests for country lists and the country catalog."""
+
+# pylint: disable=protected-access
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from orangecontrib.datasets import countries
+from orangecontrib.datasets import snapshot
+from orangecontrib.datasets.tests.test_api_wrapper import COUNTRIES
+
+
+class TestCountryCatalog(unittest.TestCase):
+    """Tests for fetching, storing and indexing the country catalog."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, countries.CATALOG_FILE_NAME)
+        patcher = mock.patch.object(countries.CountryCatalog, "get_path",
+                                    return_value=path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, countries, "_catalog", None)
+        countries._catalog = None
+        patcher = mock.patch.object(countries.snapshot, "get_countries",
+                                    return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @mock.patch("orangecontrib.datasets.transport.fetch",
+                return_value=json.dumps([{}, COUNTRIES]))
+    def test_single_fetch(self, fetch):
+        regions = countries.get_countries_regions_dict()
+        countries.get_countries_regions_dict()
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(list(regions["Countries"]), ["AUT", "SVN"])
+        self.assertIn("WLD", regions["Aggregates"]["Other"])
+
+        # a new process should use the stored catalog
+        countries._catalog = None
+        catalog = countries.get_catalog()
+        self.assertEqual(fetch.call_count, 1)
+        self.assertFalse(catalog.is_stale)
+        self.assertEqual(catalog.alpha3_map["si"], "svn")
+        self.assertEqual(catalog.alpha3_map["austria"], "aut")
+
+    @mock.patch("orangecontrib.datasets.transport.fetch",
+                side_effect=OSError)
+    def test_failed_refresh_backoff(self, fetch):
+        countries._catalog = countries.CountryCatalog(COUNTRIES, timestamp=0)
+        self.addCleanup(setattr, countries, "_revalidate_failed", 0)
+        self.addCleanup(setattr, countries, "_revalidate_thread", None)
+        for _ in range(3):
+            countries.get_catalog()
+            countries._revalidate_thread.join()
+        self.assertEqual(fetch.call_count, 1)
+
+        with mock.patch.object(countries, "CATALOG_RETRY_DELAY", 0):
+            countries.get_catalog()
+            countries._revalidate_thread.join()
+        self.assertEqual(fetch.call_count, 2)
+
+
+class TestAlpha3Names(unittest.TestCase):
+    """Tests for alpha3 code to country name lookups."""
+
+    def test_get_alpha3_map(self):
+        alpha3_map = countries.get_alpha3_map()
+        self.assertIs(alpha3_map, countries.get_alpha3_map())
+        self.assertEqual(alpha3_map["SVN"], "Slovenia")
+        # names are taken from MAPPINGS where they differ from pycountry
+        self.assertEqual(alpha3_map["TZA"], "Tanzania")
+        with self.assertRaises(TypeError):
+            alpha3_map["SVN"] = "Slovenija"
+
+    def test_alpha3_to_names(self):
+        names = countries.alpha3_to_names([["SVN"], ["XYZ"], ["SVN"]])
+        self.assertEqual(names.shape, (3, 1))
+        self.assertEqual(names[:, 0].tolist(), ["Slovenia", "XYZ", "Slovenia"])
+        self.assertEqual(countries.alpha3_to_names([]).shape, (0,))
+
+    def test_get_countries_dict(self):
+        countries_dict = countries.get_countries_dict()
+        self.assertEqual(countries_dict["Europe"]["SVN"],
+                         {"name": "Slovenia"})
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for the bundled country and indicator snapshot."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, "snapshot.json.gz")
+
+    def test_save_load(self):
+        snapshot.save(COUNTRIES, [{"id": "SP.POP.TOTL", "name": "Population",
+                                   "unit": "", "topics": []}], self.path,
+                      {"source": "test"})
+        data = snapshot.load(self.path)
+        self.assertEqual(data["metadata"], {"source": "test"})
+        self.assertEqual(data["countries"], COUNTRIES)
+        self.assertEqual(data["indicators"], [
+            {"id": "SP.POP.TOTL", "name": "Population", "topics": []}])
+
+        with mock.patch.object(snapshot, "SNAPSHOT_VERSION", 0):
+            self.assertIsNone(snapshot.load(self.path))
+        self.assertIsNone(snapshot.load(self.path + ".missing"))
+
+    def test_bundled_snapshot(self):
+        data = snapshot.load()
+        self.assertIsNotNone(data)
+        self.assertTrue(data["metadata"].get("source"))
+        self.assertGreater(data["created"], 0)
+        self.assertTrue(data["indicators"])
+        self.assertTrue(all(i["name"] and i["source"]["id"]
+                            for i in data["indicators"]))
+
+        catalog = countries.CountryCatalog(data["countries"], timestamp=0)
+        self.assertTrue(catalog.aggregate_ids)
+        self.assertTrue(catalog.country_ids)
+        for code in catalog.aggregate_ids:
+            self.assertTrue(catalog.by_id[code]["iso2Code"], code)
+        used = countries._gather_used_ids(countries.DATA_STRUCTURE)
+        self.assertFalse(used - set(catalog.aggregate_ids))
+
+    def test_invalid_snapshot(self):
+        world = dict(COUNTRIES[2], iso2Code="")
+        snapshot.save(COUNTRIES[:2] + [world], [], self.path)
+        self.assertIsNone(snapshot.load(self.path))
+        snapshot.save(COUNTRIES, [{"id": "SP.POP.TOTL"}], self.path)
+        self.assertIsNone(snapshot.load(self.path))
+
+    def test_missing_snapshot(self):
+        path = os.path.join(self.temp_dir, "missing.json.gz")
+        with mock.patch.object(snapshot, "SNAPSHOT_PATH", path), \
+                mock.patch.object(snapshot, "_snapshot", None):
+            self.assertIsNone(snapshot.get_snapshot())
+            self.assertIsNone(snapshot.get_countries())
+            self.assertIsNone(snapshot.get_indicators())
+            self.assertIsNone(countries.CountryCatalog.from_snapshot())
+
+    @mock.patch("orangecontrib.datasets.transport.fetch")
+    def test_catalog_from_snapshot(self, fetch):
+        path = os.path.join(self.temp_dir, countries.CATALOG_FILE_NAME)
+        self.addCleanup(setattr, countries, "_catalog", None)
+        countries._catalog = None
+        with mock.patch.object(countries.CountryCatalog, "get_path",
+                               return_value=path), \
+                mock.patch.object(snapshot, "get_countries",
+                                  return_value=list(COUNTRIES)):
+            catalog = countries.get_catalog(stored_only=True)
+        fetch.assert_not_called()
+        self.assertEqual(catalog.country_ids, ["AUT", "SVN"])
+        self.assertTrue(catalog.is_stale)
@@ -0,0 +1,130 @@
+"""Tests for indicator list filtering helpers."""
+
+# pylint: disable=protected-access
+
+import unittest
+
+import numpy as np
+from AnyQt.QtCore import Qt
+from Orange.widgets import gui
+
+from orangecontrib.datasets.indicators_list import (
+    NgramIndex,
+    IndicatorTable,
+    IndicatorTableModel,
+    MySortFilterProxyModel,
+    TEXTFILTERROLE,
+)
+
+
+TEXTS = [
+    " | sp.pop.totl | population, total | health | wdi",
+    " | ny.gdp.mktp.cd | gdp (current us$) | economy | wdi",
+    " | ny.gdp.mktp.kd.zg | gdp growth (annual %) | economy | wdi",
+    "",
+    " | gds1234 | čas | | ",
+]
+
+
+class TestNgramIndex(unittest.TestCase):
+    """Compare index lookups with plain substring search."""
+
+    def test_match(self):
+        index = NgramIndex(TEXTS)
+        tokens = ["gdp", "gdp growth", "p", "wd", "čas", "| ny", "missing",
+                  ""]
+        for token in tokens:
+            expected = [token in text for text in TEXTS]
+            np.testing.assert_array_equal(index.match(token), expected,
+                                          err_msg=token)
+
+    def test_candidates(self):
+        index = NgramIndex(TEXTS)
+        self.assertIsNone(index.candidates("gd"))
+        self.assertEqual(list(index.candidates("gdp")), [1, 2])
+        self.assertEqual(list(index.candidates("xyz")), [])
+
+    def test_empty(self):
+        index = NgramIndex([])
+        self.assertEqual(len(index.match("gdp")), 0)
+
+    def test_match_rows(self):
+        index = NgramIndex(TEXTS)
+        rows = np.flatnonzero(index.match("gd"))
+        np.testing.assert_array_equal(
+            index.match("gdp growth", rows=rows),
+            [False, False, True, False, False])
+        np.testing.assert_array_equal(
+            index.match("p", rows=np.array([0, 3])),
+            [True, False, False, False, False])
+
+
+class TestIndicatorTableModel(unittest.TestCase):
+    """Check data served by the indicator table model."""
+
+    INDICATORS = [
+        {
+            "id": "SP.POP.TOTL ",
+            "name": "Population, total",
+            "source": {"id": "2", "value": "WDI"},
+            "topics": [{"id": "8", "value": "Health "}, {"value": "Other"}],
+        },
+        {"id": "GDS123", "name": "GDS indicator"},
+    ]
+
+    def test_data(self):
+        model = IndicatorTableModel(self.INDICATORS)
+        self.assertEqual(model.rowCount(), 2)
+        self.assertEqual(model.columnCount(), 5)
+        self.assertEqual(model.headerData(1, Qt.Horizontal), "Id")
+
+        index = model.index(0, 1)
+        self.assertEqual(index.data(Qt.DisplayRole), "SP.POP.TOTL")
+        self.assertIn("SP.POP.TOTL", index.data(gui.LinkRole))
+        self.assertEqual(model.index(0, 3).data(), "Health, Other")
+        self.assertEqual(model.index(1, 4).data(), "")
+        self.assertEqual(
+            model.index(0, 0).data(TEXTFILTERROLE),
+            " | sp.pop.totl | population, total | health, other | wdi")
+        self.assertIsNone(model.index(1, 2).data(TEXTFILTERROLE))
+
+
+class TestSortFilterProxyModel(unittest.TestCase):
+    """Check sorting and filtering of the indicator table."""
+
+    INDICATORS = [{"id": id_, "name": name} for id_, name in [
+        ("GDS10", "b"), ("GDS9", "a"), ("SP.X", "d"), ("AB", "c"),
+    ]]
+
+    def _column(self, proxy, column):
+        return [proxy.index(row, column).data()
+                for row in range(proxy.rowCount())]
+
+    def test_sort(self):
+        proxy = MySortFilterProxyModel()
+        proxy.setSourceModel(IndicatorTableModel(self.INDICATORS))
+        proxy.sort(1, Qt.AscendingOrder)
+        self.assertEqual(self._column(proxy, 1),
+                         ["GDS9", "GDS10", "AB", "SP.X"])
+        proxy.sort(2, Qt.DescendingOrder)
+        self.assertEqual(self._column(proxy, 2), ["d", "c", "b", "a"])
+
+    def test_sort_filtered(self):
+        proxy = MySortFilterProxyModel()
+        proxy.setSourceModel(IndicatorTableModel(self.INDICATORS))
+        proxy.setFilterFixedStrings(["gds"])
+        proxy.sort(1, Qt.DescendingOrder)
+        self.assertEqual(self._column(proxy, 1), ["GDS10", "GDS9"])
+        proxy.setFilterFixedStrings([])
+        self.assertEqual(self._column(proxy, 1),
+                         ["SP.X", "AB", "GDS10", "GDS9"])
+
+    def test_prebuilt_table(self):
+        table = IndicatorTable(self.INDICATORS)
+        proxy = MySortFilterProxyModel()
+        proxy.setSourceModel(IndicatorTableModel(table))
+        self.assertIs(proxy._index, table.index)
+        self.assertIs(proxy._sort_keys, table.sort_keys)
+        proxy.setFilterFixedStrings(["sp."])
+        proxy.sort(1, Qt.AscendingOrder)
+        self.assertEqual(self._column(proxy, 1), ["SP.X"])
@@ -0,0 +1,90 @@
+"""Tests for the World Bank indicators widget."""
+
+# pylint: disable=protected-access
+
+import shutil
+import tempfile
+import warnings
+from unittest import mock
+
+from AnyQt.QtCore import Qt
+from Orange.widgets.tests.base import WidgetTest
+
+from orangecontrib.datasets import api_wrapper
+from orangecontrib.datasets import countries
+from orangecontrib.datasets import transport
+from orangecontrib.datasets.indicators_list import IndicatorTable
+from orangecontrib.datasets.tests.test_api_wrapper import _fake_fetch
+from orangecontrib.datasets.widgets.owworldbankindicators import (
+    OWWorldBankIndicators,
+)
+
+
+class TestOWWorldBankIndicators(WidgetTest):
+    """Tests for starting the widget without network access."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        patchers = [
+            mock.patch("orangecontrib.datasets.cache.get_cache_dir",
+                       return_value=self.temp_dir),
+            mock.patch("orangecontrib.datasets.transport.fetch",
+                       side_effect=OSError),
+            mock.patch("orangecontrib.datasets.transport.get_cached",
+                       return_value=None),
+            mock.patch("orangecontrib.datasets.transport.check_status",
+                       return_value=False),
+            mock.patch.object(countries, "_catalog", None),
+            mock.patch.object(countries, "_revalidate_thread", None),
+            mock.patch.object(countries, "_revalidate_failed", 0),
+            mock.patch.object(api_wrapper.IndicatorAPI, "_indicator_list",
+                              None),
+            mock.patch.object(api_wrapper.IndicatorAPI,
+                              "_indicator_sources", None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_first_launch_offline(self):
+        widget = self.create_widget(OWWorldBankIndicators)
+        # Without a stored catalog the tree is filled from the snapshot
+        # right away, before any background task has finished.
+        self.assertIsNotNone(widget._country_catalog)
+        self.assertGreater(widget.country_tree.topLevelItemCount(), 0)
+        for name in ["World", "Slovenia"]:
+            self.assertTrue(widget.country_tree.findItems(
+                name, Qt.MatchExactly | Qt.MatchRecursive), name)
+
+        self.process_events(until=lambda: widget.indicator_widget.isEnabled())
+        self.assertGreater(widget.indicator_widget.model().rowCount(), 0)
+        self.assertTrue(widget.indicator_widget._api.indicators_from_snapshot)
+
+    def test_superseded_indicator_fetch(self):
+        widget = self.create_widget(OWWorldBankIndicators)
+        view = widget.indicator_widget
+        self.process_events(until=view.isEnabled)
+        model = view.model().sourceModel()
+
+        stale = mock.Mock()
+        stale.result.return_value = (
+            {}, IndicatorTable([{"id": "OLD", "name": "Old"}]))
+        view._fetch_indicators_finished(stale)
+        self.assertIs(view.model().sourceModel(), model)
+        stale.result.assert_not_called()
+
+    def test_progress_bar_for_every_fetch(self):
+        widget = self.create_widget(OWWorldBankIndicators)
+        self.process_events(until=widget.indicator_widget.isEnabled)
+        transport.fetch.side_effect = _fake_fetch
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            for indicator in ["SP.POP.TOTL", "NY.GDP.MKTP.CD"]:
+                widget.indicator_selection = [indicator]
+                widget.unconditional_commit()
+                self.process_events(
+                    until=lambda: widget._fetch_task is None)
+                self.assertEqual(widget._dataset_query[0], (indicator,))
+        self.assertFalse([(w.filename, w.lineno) for w in caught
+                          if "progressBarInit" in str(w.message)])
@@ -0,0 +1,145 @@
+"""Shared HTTP transport for World Bank API requests.
+
+All API objects in this add-on use a single process wide requests session, so
+that connections are pooled and kept alive between requests and widgets.
+Responses are cached in the same temporary directory and for the same time as
+in simple_wbd.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+import requests
+from requests import adapters
+from simple_wbd import utils
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 16
+TIMEOUT = (5, 60)  # connect and read timeout in seconds
+RETRIES = 2
+STATUS_URL = "http://api.worldbank.org"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure(pool_size=None, timeout=None, retries=None):
+    """Change transport settings.
+
+    The shared session is recreated on next use with the new settings.
+
+    Args:
+        pool_size: maximum number of kept alive connections per host.
+        timeout: request timeout in seconds or a (connect, read) tuple.
+        retries: number of retries for failed connections.
+    """
+    # pylint: disable=global-statement
+    global POOL_SIZE, TIMEOUT, RETRIES, _session
+    with _session_lock:
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if timeout is not None:
+            TIMEOUT = timeout
+        if retries is not None:
+            RETRIES = retries
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_session():
+    """Get the shared requests session."""
+    # pylint: disable=global-statement
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = adapters.HTTPAdapter(
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE,
+                max_retries=RETRIES,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            _session = session
+        return _session
+
+
+def _get_cache_path(url):
+    cache_dir = os.path.join(tempfile.gettempdir(), utils.CACHE_DIR_NAME)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, url_hash)
+
+
+def fetch(url, use_cache=True):
+    """Return response from a URL using the shared session.
+
+    Responses are cached for utils.CACHE_TIME, same as with simple_wbd fetch.
+
+    Args:
+        url (str): Url that we want to fetch from the web.
+        use_cache (bool): Flag to enable or disable use of cache files.
+
+    Returns:
+        str: Response text.
+    """
+    logger.debug("Fetch '%s' use cache %s", url, use_cache)
+    cache_path = _get_cache_path(url)
+
+    if use_cache:
+        cached = get_cached(url)
+        if cached is not None:
+            return cached
+
+    response = get_session().get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+
+    # Write to a temporary file first so that concurrent readers never see a
+    # partially written cache file.
+    temp_path = "{}.{}".format(cache_path, threading.get_ident())
+    with open(temp_path, "wb") as cache_file:
+        cache_file.write(response.text.encode("utf-8"))
+    os.replace(temp_path, cache_path)
+
+    return response.text
+
+
+def get_cached(url):
+    """Get a cached response without using the network.
+
+    Returns:
+        str: Response text or None if there is no valid cached response.
+    """
+    cache_path = _get_cache_path(url)
+    # Another thread can remove an expired file at any point, so a missing
+    # file is treated as a cache miss instead of checking for it first.
+    try:
+        if time.time() - os.path.getmtime(cache_path) >= utils.CACHE_TIME:
+            logger.info("Removing expired cache file for %s", url)
+            os.remove(cache_path)
+            return None
+        with open(cache_path, "rb") as cache_file:
+            return cache_file.read().decode("utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def check_status(url=STATUS_URL, timeout=1):
+    """Check if the API server is reachable.
+
+    Returns:
+        bool: True if the server responded in the given time.
+    """
+    try:
+        get_session().head(url, timeout=timeout)
+        return True
+    except requests.exceptions.RequestException:
+        return False
@@ -4,9 +4,8 @@ This module contains the world bank data widget, used for fetching data from
 world bank data API.
 """
 
+import os
 import sys
-import time
-import math
 import signal
 import logging
 
@@ -18,6 +17,7 @@ from Orange.widgets.settings import Setting
 
 from orangecontrib.datasets.countries_and_regions import CountryTreeWidget
 from orangecontrib.datasets import api_wrapper
+from orangecontrib.datasets import cache
 from orangecontrib.datasets import countries
 from orangecontrib.datasets import owwidget_base
 
@@ -60,6 +60,7 @@ class OWWorldBankClimate(owwidget_base.OWWidgetBase):
     mergeSpots = Setting(True)
     auto_commit = Setting(False)
     use_country_names = Setting(False)
+    derive_decades = Setting(False)
 
     include_intervals = Setting([])
     include_data_types = Setting([])
@@ -127,13 +128,14 @@ class OWWorldBankClimate(owwidget_base.OWWidgetBase):
 
     def __init__(self):
         super().__init__()
-        self._api = api_wrapper.ClimateAPI()
+        self._api = api_wrapper.ClimateAPI(data_cache=cache.DatasetCache(
+            path=os.path.join(cache.get_cache_dir(),
+                              cache.CLIMATE_CACHE_FILE_NAME),
+            ttl=cache.CLIMATE_CACHE_TTL,
+        ))
         self._init_layout()
         self.print_selection_count()
-        try:
-            self._check_server_status()
-        except ConnectionError:
-            pass
+        self._check_server_status()
 
     def print_selection_count(self):
         """Update info widget with new selection count."""
@@ -155,6 +157,8 @@ class OWWorldBankClimate(owwidget_base.OWWidgetBase):
                                     callback=self.commit_if)
         self.ch_decade = gui.checkBox(box, self, "include_decade", 'Decade',
                                       callback=self.commit_if)
+        gui.checkBox(box, self, "derive_decades", "Compute decades from years",
+                     callback=self.commit_if)
 
         box = gui.vBox(self.controlArea, "Data Types")
         gui.checkBox(box, self, "include_temperature", "Temperature",
@@ -235,23 +239,30 @@ class OWWorldBankClimate(owwidget_base.OWWidgetBase):
         self.print_selection_count()
         super().commit_if()
 
-    def _fetch_dataset(self, set_progress=None):
+    def _fetch_dataset(self, request):
         """Fetch climate dataset."""
 
-        set_progress(0)
-        self._start_progerss_task()
-
         country_codes = self.get_country_codes()
 
         logger.debug("Fetch: selected country codes: %s", country_codes)
         climate_dataset = self._api.get_instrumental(
             country_codes,
             data_types=self.include_data_types,
-            intervals=self.include_intervals
+            intervals=self.include_intervals,
+            request=request,
+            derive_decades=self.derive_decades,
         )
-        self._set_progress_flag = False
         return climate_dataset
 
+    def _get_query(self):
+        return (tuple(sorted(self.get_country_codes())),
+                tuple(sorted(self.include_data_types)),
+                tuple(sorted(self.include_intervals)),
+                self.derive_decades)
+
+    def _get_output_options(self):
+        return (self.output_type, self.use_country_names)
+
     def _dataset_to_table(self, dataset):
         time_series = self.output_type == 1
         return dataset.as_orange_table(
@@ -259,21 +270,6 @@ class OWWorldBankClimate(owwidget_base.OWWidgetBase):
             use_names=self.use_country_names,
         )
 
-    def _dataset_progress(self, set_progress=None):
-        while self._set_progress_flag:
-            pages = self._api.progress["pages"]
-            current_page = self._api.progress["current_page"]
-            logger.debug("api progress: %s", self._api.progress)
-            if pages > 0:
-                progress = ((100 / pages) * (current_page - 1))
-                logger.debug("calculated progress: %s", progress)
-                set_progress(math.floor(progress))
-            time.sleep(1)
-
-    @staticmethod
-    def _dataset_progress_exception(exception):
-        logger.exception(exception)
-
 
 def main():  # pragma: no cover
     """Helper for running the widget without Orange."""
@@ -5,11 +5,11 @@ world bank data API.
 """
 
 import sys
-import time
-import math
 import signal
 import logging
+import datetime
 import collections
+from functools import partial
 
 from AnyQt import QtCore, QtWidgets
 from Orange.data import table
@@ -20,6 +20,7 @@ from Orange.widgets.settings import Setting
 from orangecontrib.datasets.countries_and_regions import CountryTreeWidget
 from orangecontrib.datasets.indicators_list import IndicatorsTreeView
 from orangecontrib.datasets import api_wrapper
+from orangecontrib.datasets import cache
 from orangecontrib.datasets import countries
 from orangecontrib.datasets import owwidget_base
 
@@ -63,13 +64,25 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
         "currentGds",
         "auto_commit",
         "output_type",
+        "use_date_range",
+        "date_start",
+        "date_end",
+        "use_mrv",
+        "mrv",
     ]
 
+    FIRST_YEAR = 1960
+
     country_selection = Setting({})
     indicator_selection = Setting([])
     indicator_list_selection = Setting(True)
     output_type = Setting(True)
     auto_commit = Setting(False)
+    use_date_range = Setting(False)
+    date_start = Setting(datetime.date.today().year - 10)
+    date_end = Setting(datetime.date.today().year)
+    use_mrv = Setting(False)
+    mrv = Setting(10)
 
     splitterSettings = Setting((
         b'\x00\x00\x00\xff\x00\x00\x00\x00\x00\x00\x00\x02\x00\x00\x01\xea'
@@ -80,9 +93,12 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
 
     def __init__(self):
         super().__init__()
-        self._api = api_wrapper.IndicatorAPI()
+        self._api = api_wrapper.IndicatorAPI(
+            data_cache=cache.DatasetCache())
+        self._country_catalog = None
         self._init_layout()
         self._check_server_status()
+        self._load_country_catalog()
 
     def _init_layout(self):
         """Initialize widget layout."""
@@ -101,6 +117,21 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
 
         gui.separator(indicator_filter_box)
 
+        last_year = datetime.date.today().year
+        period_box = gui.widgetBox(self.controlArea, "Period", addSpace=True)
+        date_check, _ = gui.spin(
+            period_box, self, "date_start", self.FIRST_YEAR, last_year,
+            label="From year:", checked="use_date_range",
+            checkCallback=self.commit_if, callback=self.commit_if)
+        end_spin = gui.spin(
+            period_box, self, "date_end", self.FIRST_YEAR, last_year,
+            label="To year:", callback=self.commit_if)
+        date_check.disables.append(end_spin)
+        date_check.makeConsistent()
+        gui.spin(period_box, self, "mrv", 1, last_year - self.FIRST_YEAR + 1,
+                 label="Most recent values:", checked="use_mrv",
+                 checkCallback=self.commit_if, callback=self.commit_if)
+
         output_box = gui.widgetBox(self.controlArea, "Output", addSpace=True)
         gui.radioButtonsInBox(output_box, self, "output_type",
                               ["Countries", "Time Series"], "Rows",
@@ -146,7 +177,7 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
             default_colapse=True,
         )
         box.layout().addWidget(self.country_tree)
-        self.country_tree.set_data(countries.get_countries_regions_dict())
+        self._set_country_catalog(countries.get_catalog(stored_only=True))
 
         self.splitters = spliter_v, splitter_h
 
@@ -158,6 +189,24 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
 
         self.progressBarInit()
 
+    def _load_country_catalog(self):
+        """Load or refresh the country catalog in the background."""
+        catalog = self._country_catalog
+        refresh = catalog is None or catalog.is_stale
+        self._run_in_background(
+            partial(countries.get_catalog, refresh=refresh),
+            self._set_country_catalog,
+        )
+
+    def _set_country_catalog(self, catalog):
+        """Fill the country tree with a new country catalog."""
+        if catalog is None or catalog is self._country_catalog:
+            return
+        self._country_catalog = catalog
+        self.country_tree.set_data(
+            countries.get_countries_regions_dict(catalog))
+        self.print_info()
+
     def filter_indicator_list(self):
         """Set the proxy model filter and update info box."""
         filter_string = self.filter_text.text()
@@ -186,23 +235,37 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
         self.splitterSettings = [bytes(sp.saveState())
                                  for sp in self.splitters]
 
-    def _fetch_dataset(self, set_progress=None):
+    def _fetch_dataset(self, request):
         """Fetch indicator dataset."""
-        set_progress(0)
-        self._start_progerss_task()
-
         country_codes = self.get_country_codes()
-
-        if len(country_codes) > 250:
-            country_codes = None
         logger.debug("Fetch: selected country codes: %s", country_codes)
         logger.debug("Fetch: selected indicators: %s",
                      self.indicator_selection)
-        indicator_dataset = self._api.get_dataset(self.indicator_selection,
-                                                  countries=country_codes)
-        self._set_progress_flag = False
+        indicator_dataset = self._api.get_dataset(
+            self.indicator_selection,
+            countries=country_codes,
+            request=request,
+            **self._get_period()
+        )
         return indicator_dataset
 
+    def _get_period(self):
+        """Get time period arguments for IndicatorAPI.get_dataset."""
+        return {
+            "date": ((self.date_start, self.date_end)
+                     if self.use_date_range else None),
+            "mrv": self.mrv if self.use_mrv else None,
+        }
+
+    def _get_query(self):
+        period = self._get_period()
+        return (tuple(self.indicator_selection),
+                tuple(sorted(self.get_country_codes())),
+                period["date"], period["mrv"])
+
+    def _get_output_options(self):
+        return (self.output_type,)
+
     def _dataset_to_table(self, dataset):
         time_series = self.output_type == 1
         return dataset.as_orange_table(time_series=time_series)
@@ -211,33 +274,6 @@ class OWWorldBankIndicators(owwidget_base.OWWidgetBase):
     def _fetch_dataset_exception(exception):
         logger.exception(exception)
 
-    def _dataset_progress(self, set_progress=None):
-        """Update dataset download progress.
-
-        This function reads the progress state from the world bank API and sets
-        the current widgets progress to that. All This thread should only read
-        data and ask the GUI thread to update the progress for this to be
-        thread safe.
-        """
-        while self._set_progress_flag:
-            indicators = self._api.progress["indicators"]
-            current_indicator = self._api.progress["current_indicator"]
-            indicator_pages = self._api.progress["indicator_pages"]
-            current_page = self._api.progress["current_page"]
-            logger.debug("api progress: %s", self._api.progress)
-            if indicator_pages > 0 and indicators > 0:
-                progress = (
-                    ((100 / indicators) * (current_indicator - 1)) +
-                    (100 / indicators) * (current_page / indicator_pages)
-                )
-                logger.debug("calculated progress: %s", progress)
-                set_progress(math.floor(progress))
-            time.sleep(1)
-
-    def _dataset_progress_exception(self, exception):
-        logger.exception(exception)
-        self.print_info()
-
 
 def main():  # pragma: no cover
     """Helper for running the widget without Orange."""
@@ -57,7 +57,7 @@ if __name__ == '__main__':
             'orangecontrib.datasets.widgets',
         ],
         package_data={
-            'orangecontrib.datasets': ['tutorials/*.ows'],
+            'orangecontrib.datasets': ['tutorials/*.ows', 'data/*.json.gz'],
             'orangecontrib.datasets.widgets': ['icons/*'],
         },
         install_requires=[